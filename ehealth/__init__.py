@@ -0,0 +1 @@
+"""e-health 问诊聊天机器人的支撑模块（资源缓存等），由 app_strict.py 引用。"""
@@ -0,0 +1,229 @@
+"""按 profile 生成个性化建议。
+
+剧本最后的 FINAL_ADVICE 对所有人相同；这里在它之后按患者的回答追加几条针对性的
+建议。规则表 RULES 的每条规则是 “字段 -> 可取值集合” 的合取条件，对应 assets/ 下
+饮食、运动指南中的某一条（供研究人员复核时对照）。
+
+规则表和指南文件在第一次使用时（通常是启动预热，见 ehealth/warmup.py）加载一次，
+编译成 (字段, 取值) -> 规则 的倒排索引：每个会话只需按固定的字段逐个查表，与规则
+条数无关。也可以批量为已保存的问诊打分::
+
+    python -m ehealth.advice data/consultations.db [--jsonl]
+"""
+import argparse
+import html
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from ehealth.asset_cache import APP_DIR
+from ehealth.dialogue import BUTTONS, DialogueGraph, Say
+from ehealth.normalize import iter_records, normalize_profile
+
+
+ASSETS_DIR = APP_DIR / "assets"
+GUIDELINE_FILES = ("diet", "exercise")
+MAX_TIPS = 5
+
+LEAD = "Based on your answers, here is what I would focus on first:"
+BULLET = "●"
+
+LOW_INTAKE = ("0-2 days per week",)
+FREQUENTLY = ("pretty often", "most nights")
+
+
+class AdviceError(ValueError):
+    """规则表或指南文件无效（引用了不存在的字段、取值或指南条目）。"""
+
+
+class Rule(NamedTuple):
+    id: str
+    when: Dict[str, Tuple]  # 字段 -> 可取值；多个字段同时满足才命中
+    text: str
+    guideline: Optional[Tuple[str, int]] = None  # (指南文件名, 条目序号)
+
+
+# 按优先级排列：命中多条时取前 MAX_TIPS 条
+RULES = (
+    Rule("smoke_recent", {"smoke_now": ("Yes",), "smoke_6m": ("No",)},
+         "You started smoking only recently, which makes this the easiest time to stop. Quitting now brings the biggest benefit."),
+    Rule("smoke", {"smoke_now": ("Yes",)},
+         "Quitting smoking is the most effective step you can take for your health; a quit line or nicotine replacement can double your chances of success."),
+    Rule("drink_often", {"drink_freq": ("3-5 days a week", "6-7 days a week")},
+         "Try to keep several alcohol-free days every week. When it comes to alcohol, less is better for your health."),
+    Rule("stress_high", {"work_stress": (7, 8, 9, 10)},
+         "Your work stress sounds high. Schedule short breaks during the day and protect time for the things that help you relax."),
+    Rule("inactive", {"exercise_freq": ("never", "1-2 days per week")},
+         "Build up gradually toward 150 minutes of moderate activity a week. Even 10-minute brisk walks add up.",
+         ("exercise", 0)),
+    Rule("active_strength", {"exercise_freq": ("3-5 days per week", "6+ days per week")},
+         "You are already active. Add muscle-strengthening exercises such as squats on at least 2 days a week.",
+         ("exercise", 1)),
+    Rule("lonely_exercise", {"companionship": ("often", "some of the time")},
+         "Exercising with a friend or joining a group class is a good way to stay active and connected.",
+         ("exercise", 0)),
+    Rule("sleep_poor", {"sleep_quality_1_5": (1, 2)},
+         "Your sleep quality could be better. Keep a regular bedtime and wake-up time, even on weekends."),
+    Rule("screen_bed", {"screen_before_bed": ("Yes",)},
+         "Put your phone or tablet away at least 30 minutes before bed."),
+    Rule("fall_asleep", {"diff_fall_asleep": FREQUENTLY},
+         "If you cannot fall asleep within about 20 minutes, get up and do something relaxing until you feel sleepy."),
+    Rule("night_wake", {"night_wake_diff": FREQUENTLY},
+         "Avoid caffeine in the afternoon and alcohol in the evening; both disturb sleep later in the night."),
+    Rule("tired_family", {"morning_tired": FREQUENTLY, "family_sleep_history": ("yes",)},
+         "Feeling tired most mornings with a family history of sleep disorders is worth raising with your doctor; a sleep assessment may help."),
+    Rule("fruit_low", {"fruit_freq": LOW_INTAKE},
+         "Add a piece of whole fruit to your day, for example with breakfast.", ("diet", 0)),
+    Rule("veg_low", {"veg_freq": LOW_INTAKE},
+         "Aim to have vegetables with at least one meal every day.", ("diet", 0)),
+    Rule("grain_low", {"grain_freq": LOW_INTAKE},
+         "Include whole grains such as oatmeal, brown rice or whole-wheat bread more often.", ("diet", 0)),
+    Rule("protein_low", {"protein_freq": LOW_INTAKE},
+         "Include a protein food such as beans, eggs, fish or nuts in more of your meals.", ("diet", 0)),
+    Rule("dairy_low", {"dairy_freq": LOW_INTAKE},
+         "Add a serving of milk, yogurt or cheese (or a fortified soy alternative) on more days.", ("diet", 0)),
+    Rule("no_cooking", {"cook_at_home": ("No",)},
+         "Cooking at home a few times a week makes it easier to limit added sugars, saturated fat and salt.", ("diet", 2)),
+    Rule("no_new_recipes", {"try_new_recipes": ("Never", "Rarely")},
+         "Trying a new recipe now and then is an easy way to add variety that suits your taste and budget.", ("diet", 1)),
+)
+
+
+def tips_message(tips: Iterable[str]) -> Tuple[Say, ...]:
+    """建议文本 -> 医生的一条消息；没有建议时不说。建议可能来自外部后端，按纯文本转义。"""
+    tips = list(tips)
+    if not tips:
+        return ()
+    return (Say("doctor", LEAD + "\n\n" + "\n".join(BULLET + html.escape(tip) for tip in tips)),)
+
+
+class Guideline(NamedTuple):
+    title: str
+    items: Tuple[str, ...]
+
+
+def load_guideline(path: Path) -> Guideline:
+    """指南文件格式：第一行标题，其后每条以 “- ” 开头。"""
+    lines = [line.strip() for line in path.read_text(encoding="utf-8").splitlines() if line.strip()]
+    if not lines:
+        raise AdviceError(f"{path} is empty")
+    return Guideline(lines[0], tuple(line[2:].strip() for line in lines[1:] if line.startswith("- ")))
+
+
+class AdviceEngine:
+    def __init__(self, rules: Iterable[Rule], guidelines: Dict[str, Guideline]):
+        self.rules = tuple(rules)
+        self.guidelines = guidelines
+        # (字段, 取值) -> 规则序号；只需查这些字段
+        self.index: Dict[Tuple[str, object], List[int]] = {}
+        for i, rule in enumerate(self.rules):
+            if not rule.when:
+                raise AdviceError(f"rule {rule.id!r} has no condition")
+            for key, values in rule.when.items():
+                for value in values:
+                    self.index.setdefault((key, value), []).append(i)
+            if rule.guideline is not None:
+                name, item = rule.guideline
+                if name not in guidelines or not 0 <= item < len(guidelines[name].items):
+                    raise AdviceError(f"rule {rule.id!r} refers to missing guideline {name}[{item}]")
+        self.keys = tuple(sorted({key for key, _ in self.index}))
+        self._sizes = [len(rule.when) for rule in self.rules]
+
+    def match(self, profile: Dict) -> List[Rule]:
+        """返回命中的规则（按优先级）；每个字段查一次索引。"""
+        hits: Dict[int, int] = {}
+        for key in self.keys:
+            for i in self.index.get((key, profile.get(key)), ()):
+                hits[i] = hits.get(i, 0) + 1
+        return [self.rules[i] for i in sorted(hits) if hits[i] == self._sizes[i]]
+
+    def tips(self, profile: Dict) -> List[Rule]:
+        # 同一指南条目只给一条（例如多个食物组都偏少时只保留最靠前的一条）
+        tips, seen = [], set()
+        for rule in self.match(profile):
+            if rule.guideline is not None:
+                if rule.guideline in seen:
+                    continue
+                seen.add(rule.guideline)
+            tips.append(rule)
+            if len(tips) == MAX_TIPS:
+                break
+        return tips
+
+    def message(self, profile: Dict) -> Tuple[Say, ...]:
+        return tips_message([rule.text for rule in self.tips(profile)])
+
+    def validate(self, graph: DialogueGraph, profile_keys: Iterable[str]) -> None:
+        """规则引用的字段必须是 profile 字段；按钮阶段的取值必须是该阶段的选项。"""
+        keys = set(profile_keys)
+        options = {
+            node.profile_key: {o.strip("[] ") for o in node.options}
+            for node in graph.nodes.values()
+            if node.input == BUTTONS and node.profile_key
+        }
+        for rule in self.rules:
+            for key, values in rule.when.items():
+                if key not in keys:
+                    raise AdviceError(f"rule {rule.id!r} uses unknown profile field {key!r}")
+                unknown = [v for v in values if key in options and v not in options[key]]
+                if unknown:
+                    raise AdviceError(f"rule {rule.id!r}: {unknown} are not options of {key!r}")
+
+
+def load(assets_dir: Path = ASSETS_DIR) -> AdviceEngine:
+    guidelines = {name: load_guideline(assets_dir / f"{name}.txt") for name in GUIDELINE_FILES}
+    return AdviceEngine(RULES, guidelines)
+
+
+_lock = threading.Lock()
+_engine: Optional[AdviceEngine] = None
+
+
+def engine() -> AdviceEngine:
+    """进程级实例，第一次调用时加载。"""
+    global _engine
+    if _engine is None:
+        with _lock:
+            if _engine is None:
+                _engine = load()
+    return _engine
+
+
+# ---------------- 批量 -----------------
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m ehealth.advice", description=__doc__.split("\n")[0])
+    parser.add_argument("paths", nargs="+", type=Path, help="consultations .db or .jsonl files")
+    parser.add_argument("--jsonl", action="store_true", help="print the matched rules of every consultation")
+    args = parser.parse_args(argv)
+
+    advice = engine()
+    counts = {rule.id: 0 for rule in advice.rules}
+    total = 0
+    started = time.perf_counter()
+    for path in args.paths:
+        for record in iter_records(path):
+            ids = [rule.id for rule in advice.tips(normalize_profile(record["profile"]))]
+            for rule_id in ids:
+                counts[rule_id] += 1
+            total += 1
+            if args.jsonl:
+                sys.stdout.write(json.dumps({"id": record["id"], "rules": ids}) + "\n")
+    elapsed = time.perf_counter() - started
+    if not args.jsonl:
+        for rule in advice.rules:
+            share = counts[rule.id] / total if total else 0.0
+            source = ""
+            if rule.guideline is not None:
+                name, item = rule.guideline
+                source = f"  [{name}] {advice.guidelines[name].items[item]}"
+            print(f"{rule.id:<16} {counts[rule.id]:>8} {share:>7.1%}{source}")
+    rate = total / elapsed if elapsed else 0.0
+    print(f"scored {total} consultations in {elapsed:.3f}s ({rate:.0f}/s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
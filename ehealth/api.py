@@ -0,0 +1,244 @@
+"""问诊的 HTTP/JSON 接口（asyncio，无第三方依赖）。
+
+与 Streamlit 前端共用同一个对话引擎（ehealth/engine.py）和会话存储
+（ehealth/session_store.py）：每个请求只是“读会话 → 引擎处理一次回答 → 写回”，
+没有脚本 rerun 和页面渲染，单进程即可支撑每秒数千次交互。会话存储为 sqlite/redis
+时，API 与 Streamlit 进程看到的是同一批会话。
+
+    python -m ehealth.api [--host 127.0.0.1] [--port 8600]
+
+接口（请求和响应体均为 JSON）：
+
+- POST   /sessions                   新建会话，返回开场消息和可用的输入方式
+- POST   /sessions/<sid>/answer      {"value": "..."}，返回本次新增的消息
+- GET    /sessions/<sid>             完整的会话记录
+- DELETE /sessions/<sid>             删除会话
+- GET    /healthz
+
+回答不符合当前阶段返回 400，会话不存在返回 404，会话同时被其他请求/进程推进、或正停在
+Streamlit 前端的首页时返回 409，其余异常记入 stderr 并返回 500。
+
+请求在线程池中处理：会话存储、事件/问诊队列和推荐后端的调用可能阻塞，不能放在事件循环上。
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import traceback
+import uuid
+from http import HTTPStatus
+from typing import Dict, List, Optional, Tuple
+
+from ehealth import consultations, events, metrics
+from ehealth.engine import Engine, InvalidAnswer, new_state
+from ehealth.messages import SCRIPT_TEXTS, Message
+from ehealth.script import GRAPH
+from ehealth.session_store import STORE as SESSION_STORE, ConflictError
+
+
+API_HOST = os.environ.get("EHEALTH_API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("EHEALTH_API_PORT", "8600"))
+MAX_BODY_BYTES = 64 * 1024
+
+ENGINE = Engine(GRAPH)
+
+
+def _engine(pending: List) -> Engine:
+    """本次请求用的引擎：事件先暂存在 pending，会话写回成功后再提交。"""
+    return Engine(GRAPH, on_event=lambda state, event: pending.append(events.stamp(event)))
+
+
+class ApiError(Exception):
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def _message_json(m: Message) -> Dict:
+    return {"role": m.role, "text": m.content, "image": m.image_path, "delay": m.delay}
+
+
+def _view(sid: str, state: Dict, messages: List[Message]) -> Dict:
+    controls = ENGINE.controls(state)
+    return {
+        "sid": sid,
+        "stage": state["stage"],
+        "finished": ENGINE.finished(state),
+        "input": controls.input,
+        "options": list(controls.options),
+        "placeholder": controls.placeholder,
+        "messages": [_message_json(m) for m in messages],
+        "count": len(state["messages"]),
+    }
+
+
+# ---------------- 业务处理（同步，不涉及 I/O 等待） -----------------
+def create_session() -> Dict:
+    sid = uuid.uuid4().hex
+    state = new_state(GRAPH)
+    pending = [events.stamp((events.NEW, SCRIPT_TEXTS.version))]
+    _engine(pending).start(state)
+    SESSION_STORE.save(sid, state, None)
+    events.submit(sid, pending)
+    metrics.session_started()
+    return _view(sid, state, state["messages"])
+
+
+def _load(sid: str):
+    loaded = SESSION_STORE.load(sid)
+    if loaded is None:
+        raise ApiError(HTTPStatus.NOT_FOUND, f"unknown session {sid}")
+    if loaded.state["stage"] not in GRAPH.nodes:
+        # 共享存储里由 Streamlit 前端写入、停在首页（landing）的会话
+        raise ApiError(HTTPStatus.CONFLICT, f"session {sid} is not in a consultation")
+    return loaded
+
+
+def answer(sid: str, value) -> Dict:
+    if not isinstance(value, str):
+        raise ApiError(HTTPStatus.BAD_REQUEST, "'value' must be a string")
+    loaded = _load(sid)
+    # 复制可变字段：内存存储返回的是共享对象，并发请求不能原地修改
+    state = dict(loaded.state, profile=dict(loaded.state["profile"]), messages=list(loaded.state["messages"]),
+                 said=set(loaded.state["said"]))
+    pending: List = []
+    try:
+        added = _engine(pending).answer(state, value)
+    except InvalidAnswer as exc:
+        raise ApiError(HTTPStatus.BAD_REQUEST, str(exc)) from None
+    try:
+        SESSION_STORE.save(sid, state, loaded)
+    except ConflictError:
+        metrics.session_conflict()
+        raise ApiError(HTTPStatus.CONFLICT, "session was updated concurrently; reload and retry") from None
+    events.submit(sid, pending)
+    if ENGINE.finished(state):
+        consultations.submit(sid, state["profile"], state["messages"])
+    return _view(sid, state, added)
+
+
+def transcript(sid: str) -> Dict:
+    state = _load(sid).state
+    view = _view(sid, state, state["messages"])
+    view["profile"] = state["profile"]
+    return view
+
+
+def dispatch(method: str, path: str, body: bytes) -> Tuple[HTTPStatus, Dict]:
+    parts = [p for p in path.split("?", 1)[0].split("/") if p]
+    if parts == ["healthz"] and method == "GET":
+        return HTTPStatus.OK, {"ok": True}
+    if not parts or parts[0] != "sessions" or len(parts) > 3:
+        raise ApiError(HTTPStatus.NOT_FOUND, f"no route for {path}")
+    if len(parts) == 1:
+        if method != "POST":
+            raise ApiError(HTTPStatus.METHOD_NOT_ALLOWED, method)
+        return HTTPStatus.CREATED, create_session()
+    sid = parts[1]
+    if len(parts) == 3:
+        if parts[2] != "answer":
+            raise ApiError(HTTPStatus.NOT_FOUND, f"no route for {path}")
+        if method != "POST":
+            raise ApiError(HTTPStatus.METHOD_NOT_ALLOWED, method)
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "body is not valid JSON") from None
+        if not isinstance(payload, dict):
+            raise ApiError(HTTPStatus.BAD_REQUEST, "body must be a JSON object")
+        return HTTPStatus.OK, answer(sid, payload.get("value"))
+    if method == "GET":
+        return HTTPStatus.OK, transcript(sid)
+    if method == "DELETE":
+        _load(sid)
+        SESSION_STORE.delete(sid)
+        return HTTPStatus.OK, {"sid": sid, "deleted": True}
+    raise ApiError(HTTPStatus.METHOD_NOT_ALLOWED, method)
+
+
+# ---------------- HTTP/1.1（keep-alive） -----------------
+def _response(status: HTTPStatus, payload: Dict, keep_alive: bool) -> bytes:
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    head = (
+        f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+        "Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    return head.encode("latin-1") + body
+
+
+async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            try:
+                method, target, version = request_line.decode("latin-1").split()
+            except ValueError:
+                writer.write(_response(HTTPStatus.BAD_REQUEST, {"error": "malformed request line"}, False))
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            try:
+                length = int(headers.get("content-length") or 0)
+            except ValueError:
+                length = -1
+            if length < 0:
+                writer.write(_response(HTTPStatus.BAD_REQUEST, {"error": "bad content-length"}, False))
+                break
+            if length > MAX_BODY_BYTES:
+                writer.write(_response(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "body too large"}, False))
+                break
+            body = await reader.readexactly(length) if length else b""
+            keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+            try:
+                status, payload = await loop.run_in_executor(None, dispatch, method, target, body)
+            except ApiError as exc:
+                status, payload = exc.status, {"error": str(exc)}
+            except Exception:
+                print(f"ehealth API: {method} {target} failed", file=sys.stderr)
+                traceback.print_exc()
+                status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "internal server error"}
+            writer.write(_response(status, payload, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host: str = API_HOST, port: int = API_PORT, ready: Optional[asyncio.Future] = None) -> None:
+    server = await asyncio.start_server(handle_connection, host, port, backlog=1024)
+    bound = server.sockets[0].getsockname()
+    print(f"ehealth API listening on http://{bound[0]}:{bound[1]}", flush=True)
+    if ready is not None:
+        ready.set_result(bound[1])
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m ehealth.api", description=__doc__.split("\n")[0])
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,146 @@
+"""进程级图片资源缓存。
+
+Streamlit 每次 rerun 都会重新执行 app_strict.py，但被 import 的模块只加载一次，
+因此缓存放在这里即可被所有会话共享。条目按解析后的路径缓存，并用 mtime/size
+校验文件是否变化；总字节数受 LRU 预算约束。
+"""
+import base64
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional
+
+from ehealth.metrics import REGISTRY
+
+APP_DIR = Path(__file__).resolve().parent.parent
+
+# 默认 8 MB，足够容纳两张宣传册图片的 data URL（约 830 KB）
+DEFAULT_BUDGET_BYTES = int(os.environ.get("EHEALTH_ASSET_CACHE_BYTES", 8 * 1024 * 1024))
+
+
+class _Entry(NamedTuple):
+    mtime_ns: int
+    size: int
+    data_url: str
+
+
+def resolve_asset(image_path: str) -> Optional[Path]:
+    """按 原路径 → 应用目录 → 当前工作目录 的顺序查找图片文件。"""
+    candidate_paths = [
+        Path(image_path),
+        APP_DIR / image_path,
+        Path.cwd() / image_path,
+    ]
+    for p in candidate_paths:
+        try:
+            if p.is_file():
+                return p.resolve()
+        except Exception:
+            continue
+    return None
+
+
+def encode_data_url(path: Path, data_bytes: bytes) -> str:
+    mime, _ = mimetypes.guess_type(str(path))
+    if not mime:
+        mime = "image/png"
+    b64 = base64.b64encode(data_bytes).decode("ascii")
+    return f"data:{mime};base64,{b64}"
+
+
+class AssetCache:
+    """按 (路径, mtime, size) 缓存 data URL 的 LRU 缓存，线程安全。"""
+
+    def __init__(self, budget_bytes: int = DEFAULT_BUDGET_BYTES):
+        self.budget_bytes = budget_bytes
+        self._lock = threading.Lock()
+        self._resolved: Dict[str, Path] = {}
+        self._entries: "OrderedDict[Path, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _resolve(self, image_path: str) -> Optional[Path]:
+        # 路径解析结果也缓存，避免每次都探测三个候选位置
+        path = self._resolved.get(image_path)
+        if path is None:
+            path = resolve_asset(image_path)
+            if path is not None:
+                self._resolved[image_path] = path
+        return path
+
+    def _drop(self, path: Path) -> None:
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self._bytes -= len(entry.data_url)
+
+    def data_url(self, image_path: str) -> Optional[str]:
+        """返回图片的 data URL；文件不存在或不可读时返回 None。"""
+        with self._lock:
+            path = self._resolve(image_path)
+            if path is None:
+                return None
+            try:
+                st = path.stat()
+            except OSError:
+                # 文件被移走：清掉解析结果和缓存，下次重新探测
+                self._resolved.pop(image_path, None)
+                self._drop(path)
+                return None
+
+            entry = self._entries.get(path)
+            if entry is not None:
+                if entry.mtime_ns == st.st_mtime_ns and entry.size == st.st_size:
+                    self._entries.move_to_end(path)
+                    self.hits += 1
+                    return entry.data_url
+                self.invalidations += 1
+                self._drop(path)
+            self.misses += 1
+
+        # 读盘和编码放在锁外，避免阻塞其他会话的命中
+        try:
+            data_bytes = path.read_bytes()
+        except Exception:
+            return None
+        data_url = encode_data_url(path, data_bytes)
+
+        with self._lock:
+            cost = len(data_url)
+            if cost > self.budget_bytes:
+                return data_url
+            self._drop(path)
+            while self._entries and self._bytes + cost > self.budget_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.data_url)
+                self.evictions += 1
+            self._entries[path] = _Entry(st.st_mtime_ns, st.st_size, data_url)
+            self._bytes += cost
+        return data_url
+
+    def clear(self) -> None:
+        with self._lock:
+            self._resolved.clear()
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "budget_bytes": self.budget_bytes,
+            }
+
+
+# 进程级共享实例
+asset_cache = AssetCache()
+REGISTRY.add_collector(lambda: {f"asset_cache_{k}": v for k, v in asset_cache.stats().items()})
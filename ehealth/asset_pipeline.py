@@ -0,0 +1,159 @@
+"""宣传册图片的缩放/压缩流水线。
+
+聊天气泡里的图片最大只显示 300x400 像素，原图却有上千像素宽。这里按显示框
+生成 1x/2x 两档的 WebP 与优化 PNG 变体，写到 static/ 下并以源文件内容哈希命名，
+已存在的变体直接复用，因此进程重启或多进程部署不会重复编码。
+
+也可以在部署前手动构建::
+
+    python -m ehealth.asset_pipeline [图片路径 ...]
+
+Pillow 不可用或处理失败时返回 None，调用方继续使用原图。
+"""
+import io
+import os
+import sys
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from ehealth.asset_cache import resolve_asset
+from ehealth.static_assets import STATIC_DIR, content_hash, publish_bytes
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow 随 streamlit 安装，一般都可用
+    Image = None
+
+
+# 与 render_custom_chat 中图片的 max-width / max-height 保持一致
+DISPLAY_BOX = (300, 400)
+DENSITIES = (1, 2)
+WEBP_QUALITY = 80
+# 编码参数变化时递增，使旧的磁盘缓存自然失效
+PIPELINE_VERSION = "v1"
+
+DEFAULT_SOURCES = ("图片1.png", "图片2.png")
+
+
+class Variant(NamedTuple):
+    path: Path
+    width: int
+    height: int
+    density: int
+    mime: str
+
+
+class VariantSet(NamedTuple):
+    digest: str
+    webp: List[Variant]
+    png: List[Variant]
+
+    @property
+    def version(self) -> str:
+        return f"{self.digest}{PIPELINE_VERSION}"
+
+
+_lock = threading.Lock()
+# 源文件 (路径, mtime, size) -> 变体集合
+_variants: Dict[Tuple[Path, int, int], VariantSet] = {}
+
+
+def fit_size(size: Tuple[int, int], box: Tuple[int, int], density: int) -> Tuple[int, int]:
+    """等比缩放到 box*density 以内，不放大原图。"""
+    w, h = size
+    scale = min(box[0] * density / w, box[1] * density / h, 1.0)
+    return max(1, round(w * scale)), max(1, round(h * scale))
+
+
+def _encode(im, fmt: str) -> bytes:
+    buf = io.BytesIO()
+    if fmt == "WEBP":
+        im.save(buf, "WEBP", quality=WEBP_QUALITY, method=6)
+    else:
+        # 调色板量化后再做 PNG 优化，作为不支持 WebP 的浏览器的回退
+        im.quantize(256, method=Image.Quantize.FASTOCTREE).save(buf, "PNG", optimize=True)
+    return buf.getvalue()
+
+
+def build_variants(source: Path, data_bytes: Optional[bytes] = None) -> VariantSet:
+    if data_bytes is None:
+        data_bytes = source.read_bytes()
+    digest = content_hash(data_bytes)
+    with Image.open(io.BytesIO(data_bytes)) as original:
+        original.load()
+        sizes = []
+        for density in DENSITIES:
+            size = fit_size(original.size, DISPLAY_BOX, density)
+            # 原图不够大时高倍档会和低倍档重复，跳过
+            if sizes and sizes[-1][1] == size:
+                continue
+            sizes.append((density, size))
+
+        webp, png = [], []
+        for density, (w, h) in sizes:
+            resized = None
+            for fmt, ext, mime, out in (
+                ("WEBP", "webp", "image/webp", webp),
+                ("PNG", "png", "image/png", png),
+            ):
+                name = f"asset-{digest}-{PIPELINE_VERSION}-{w}w.{ext}"
+                target = STATIC_DIR / name
+                if not target.is_file():
+                    if resized is None:
+                        resized = original.resize((w, h), Image.LANCZOS)
+                    publish_bytes(name, _encode(resized, fmt))
+                out.append(Variant(target, w, h, density, mime))
+    return VariantSet(digest, webp, png)
+
+
+def pamphlet_variants(image_path: str) -> Optional[VariantSet]:
+    """返回图片的缩放变体（按需构建，进程内缓存）；不可用时返回 None。"""
+    if Image is None:
+        return None
+    source = resolve_asset(image_path)
+    if source is None:
+        return None
+    try:
+        st = source.stat()
+    except OSError:
+        return None
+    key = (source, st.st_mtime_ns, st.st_size)
+    with _lock:
+        variants = _variants.get(key)
+        if variants is None:
+            try:
+                variants = build_variants(source)
+            except Exception:
+                return None
+            _variants[key] = variants
+    return variants
+
+
+def warm(sources: Iterable[str] = DEFAULT_SOURCES) -> None:
+    for image_path in sources:
+        pamphlet_variants(image_path)
+
+
+def main(argv: List[str]) -> int:
+    if Image is None:
+        print("Pillow is not installed; nothing to build.", file=sys.stderr)
+        return 1
+    status = 0
+    for image_path in argv or DEFAULT_SOURCES:
+        source = resolve_asset(image_path)
+        if source is None:
+            print(f"missing: {image_path}", file=sys.stderr)
+            status = 1
+            continue
+        variants = build_variants(source)
+        original = source.stat().st_size
+        for v in variants.webp + variants.png:
+            size = os.path.getsize(v.path)
+            print(f"{image_path} -> {v.path.name} {v.width}x{v.height} @{v.density}x "
+                  f"{size} bytes ({size / original:.1%} of source)")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
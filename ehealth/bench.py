@@ -0,0 +1,546 @@
+"""无界面的多会话压测/基准脚本。
+
+用 streamlit.testing.v1.AppTest 驱动 app_strict.py，按预设场景（在职/失业、吸烟、
+饮酒、从不运动……）从头到尾走完整个问诊，每个会话在独立的工作进程中运行
+（AppTest 会改写进程级的 Runtime 单例，同一进程内不能并发），N 个会话并行。
+
+统计每次脚本运行的耗时（进程内 metrics 记录）、每次用户操作的往返耗时（含 AppTest
+自身开销）、每次 rerun 下发的 HTML/JSON 字节数、各工作进程的峰值 RSS，以及场景
+覆盖到的对话图分支。结果可保存为基线，之后与基线比较以发现性能回退::
+
+    python -m ehealth.bench --sessions 8 --rounds 2
+    python -m ehealth.bench --save                  # benchmarks/baseline-component.json
+    python -m ehealth.bench --mode html --compare   # benchmarks/baseline-html.json
+
+默认与应用一致，驱动聊天组件（component）；每种渲染方式各有一份基线，不给路径时按
+--mode 和 --lite 选择（baseline-<mode>[-lite].json）；与记录时模式不同的基线拒绝比较。
+
+加 --api URL 时改为压测已启动的 HTTP/JSON 接口（python -m ehealth.api），用同样的
+场景、--concurrency 个长连接并发，报告每秒会话数/请求数与请求延迟::
+
+    python -m ehealth.bench --api http://127.0.0.1:8600 --sessions 2000 --concurrency 100
+
+比较时超出容差的指标会列出并以退出码 1 结束。
+
+--lite on 以精简渲染模式（EHEALTH_LITE）运行；--lite both 先后跑默认和精简模式并对比。
+没有浏览器可测，客户端渲染成本用静态指标近似：最终对话记录的元素数、带延迟播放
+（计时器）的消息数、含动画/阴影/渐变/模糊等效果的 CSS 规则数，以及页面下发的
+CSS/JS 字节数。
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
+
+from ehealth.asset_cache import APP_DIR
+from ehealth.dialogue import BUTTONS, END, TEXT
+from ehealth.script import GRAPH
+
+
+APP_SCRIPT = APP_DIR / "app_strict.py"
+BASELINE_DIR = APP_DIR / "benchmarks"
+
+
+def default_baseline(mode: str, lite: bool) -> str:
+    """每种渲染方式（模式 × 是否精简）各一份基线。"""
+    return str(BASELINE_DIR / f"baseline-{mode}{'-lite' if lite else ''}.json")
+
+
+RUN_TIMEOUT = 30  # 单次 AppTest.run 的超时（秒）
+MAX_STEPS = 200   # 防止场景写错时死循环
+
+# 与基线比较时允许的相对增幅；延迟受机器负载影响较大，容差放宽
+TOLERANCE = {
+    "script_ms.p50": 0.5,
+    "script_ms.p90": 0.5,
+    "action_ms.p50": 0.5,
+    "action_ms.p90": 0.5,
+    "payload_bytes.mean": 0.05,
+    "payload_bytes.max": 0.05,
+    "reruns_per_session": 0.0,
+    "peak_rss_kb": 0.25,
+}
+
+
+class Scenario(NamedTuple):
+    name: str
+    answers: Dict[str, str]  # stage -> 选项文字或自由文本；未列出的按钮阶段选第一个选项
+
+
+DEFAULT_TEXT = {
+    "doctor_name_input": "Sam",
+    "doctor_issues_detail": "asthma",
+    "doctor_job": "engineer",
+    "doctor_stress": "7",
+    "doctor_relax": "reading",
+    "doctor_exercise_types": "running",
+    "doctor_sleep_quality": "4",
+}
+
+SCENARIOS = (
+    Scenario("employed", {
+        "doctor_ongoing": "[Yes]", "doctor_smoke": "[No]", "doctor_drink": "[No]",
+        "doctor_exercise": "[3-5 days per week]", "doctor_companionship": "[often]",
+    }),
+    Scenario("unemployed", {
+        "doctor_feel": "[bad]", "doctor_topics": "[sleep]", "doctor_ongoing": "[No]",
+        "doctor_job": "unemployed now", "doctor_smoke": "[No]", "doctor_drink": "[No]",
+        "doctor_exercise": "[1-2 days per week]", "doctor_companionship": "[some of the time]",
+    }),
+    Scenario("smoker", {
+        "doctor_feel": "[hard to say]", "doctor_ongoing": "[No]", "doctor_job": "retired",
+        "doctor_smoke": "[Yes]", "doctor_smoke_6m": "[Yes]", "doctor_drink": "[No]",
+        "doctor_exercise": "[6+ days per week]",
+    }),
+    Scenario("drinker", {
+        "doctor_topics": "[fitness]", "doctor_ongoing": "[Yes]", "doctor_smoke": "[Yes]",
+        "doctor_smoke_6m": "[No]", "doctor_drink": "[Yes]", "doctor_drink_freq": "[6-7 days a week]",
+        "doctor_exercise": "[3-5 days per week]", "doctor_companionship": "[Hardly ever or never]",
+    }),
+    Scenario("never_exercise", {
+        "doctor_ongoing": "[No]", "doctor_job": "student", "doctor_smoke": "[No]",
+        "doctor_drink": "[Yes]", "doctor_drink_freq": "[1-2 days a week]",
+        "doctor_exercise": "[never]", "doctor_cook": "[No]", "doctor_recipes": "[Never]",
+        "doctor_screen": "[No]", "doctor_family_sleep": "[no]",
+    }),
+)
+SCENARIOS_BY_NAME = {s.name: s for s in SCENARIOS}
+
+
+def choose_answer(scenario: Scenario, node) -> str:
+    if node.input == TEXT:
+        return scenario.answers.get(node.id, DEFAULT_TEXT.get(node.id, "ok"))
+    return scenario.answers.get(node.id, node.options[0] if node.options else "")
+
+
+def percentile(values: List[float], q: float) -> float:
+    """最近秩百分位；空列表返回 0。"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), round(q / 100 * len(ordered) + 0.5)))
+    return ordered[rank - 1]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "p50": round(percentile(values, 50), 3),
+        "p90": round(percentile(values, 90), 3),
+        "p99": round(percentile(values, 99), 3),
+        "max": round(max(values, default=0.0), 3),
+        "mean": round(sum(values) / len(values), 3) if values else 0.0,
+    }
+
+
+# 浏览器绘制代价较高的 CSS 效果
+EFFECT = re.compile(r"animation|transition|box-shadow|gradient|filter:")
+
+
+# ---------------- 工作进程 -----------------
+_records: List[Tuple[float, int]] = []  # (脚本耗时 ms, 下发字节数)
+
+
+def _init_worker(mode: str, lite: bool) -> None:
+    os.environ["EHEALTH_CHAT_MODE"] = mode
+    os.environ["EHEALTH_LITE"] = "on" if lite else "off"
+    # 压测产生的问诊记录、事件流和检查点不写进应用的 data/ 目录
+    os.environ.setdefault("EHEALTH_STORE", "off")
+    os.environ.setdefault("EHEALTH_EVENTS", "off")
+    os.environ.setdefault("EHEALTH_CHECKPOINT_PATH", os.path.join(tempfile.gettempdir(), "ehealth-bench-checkpoints.db"))
+    os.chdir(APP_DIR)  # 读取 .streamlit/config.toml，与真实部署一致
+    if str(APP_DIR) not in sys.path:
+        sys.path.insert(0, str(APP_DIR))
+    from ehealth import metrics
+    # 只需要进程内回调，不导出 /metrics 也不写日志
+    metrics.ENABLED = True
+    metrics.add_listener(lambda record, elapsed: _records.append(
+        (elapsed * 1000, record.payload_bytes)))
+
+
+class _Driver:
+    """把场景答案转成一次 AppTest 交互：html 模式点原生按钮/文本框，组件模式写组件返回值。"""
+
+    def __init__(self, at, mode: str):
+        self.at = at
+        self.mode = mode
+        self.seq = 0
+
+    def answer(self, node, value: str) -> None:
+        at = self.at
+        if self.mode == "component":
+            self.seq += 1
+            at.session_state["chat"] = {
+                "seq": self.seq,
+                "kind": "option" if node.input == BUTTONS else "text",
+                "value": value,
+                "have": at.session_state["chat_sent"] if "chat_sent" in at.session_state else 0,
+            }
+        elif node.input == BUTTONS:
+            matches = [b for b in at.button if b.label == value]
+            if not matches:
+                raise RuntimeError(f"stage {node.id!r}: no button {value!r}")
+            matches[0].click()
+        else:
+            at.chat_input[0].set_value(value)
+        at.run(timeout=RUN_TIMEOUT)
+
+
+def _session(at) -> Dict:
+    """应用在运行结束后不再把对话状态留在 st.session_state 里，从会话存储读取。"""
+    from ehealth.session_store import STORE
+
+    return STORE.load(at.session_state["sid"]).state
+
+
+def _hops(stage: str, next_stage: str) -> List[Tuple[str, str]]:
+    """一次操作走过的边：AUTO 阶段在同一次运行里被连续推进，需沿图补全。"""
+    for b in GRAPH[stage].branches:
+        hops = [(stage, b.next)]
+        current = b.next
+        while current != next_stage and GRAPH[current].input not in (BUTTONS, TEXT, END):
+            following = GRAPH[current].branches[0].next
+            hops.append((current, following))
+            current = following
+        if current == next_stage:
+            return hops
+    return [(stage, next_stage)]
+
+
+def render_cost(messages: List, lite: bool, mode: str) -> Dict[str, int]:
+    """最终对话记录在客户端的渲染成本（静态近似）；组件前端始终加载播放脚本。"""
+    from ehealth.chat_render import CHAT_CSS, CHAT_LITE_CSS, PLAYBACK_JS, render_message, render_message_lite
+
+    renderer = render_message_lite if lite else render_message
+    html = "".join(renderer(i, m) for i, m in enumerate(messages))
+    css = CHAT_LITE_CSS if lite else CHAT_CSS
+    return {
+        "dom_nodes": len(re.findall(r"<[a-z]", html)),
+        "timers": html.count(" data-d="),
+        "effect_rules": sum(1 for rule in css.split("}") if EFFECT.search(rule)),
+        "css_bytes": len(css.encode("utf-8")),
+        "js_bytes": 0 if lite and mode == "html" else len(PLAYBACK_JS.encode("utf-8")),
+    }
+
+
+def run_session(scenario_name: str) -> Dict:
+    from streamlit.testing.v1 import AppTest
+
+    scenario = SCENARIOS_BY_NAME[scenario_name]
+    mode = os.environ["EHEALTH_CHAT_MODE"]
+    _records.clear()
+    action_ms: List[float] = []
+    edges = set()
+
+    at = AppTest.from_file(str(APP_SCRIPT), default_timeout=RUN_TIMEOUT)
+    at.run()
+    if at.exception:
+        raise RuntimeError(f"first run: {at.exception[0].value}")
+    driver = _Driver(at, mode)
+    stage = _session(at)["stage"]
+    for _ in range(MAX_STEPS):
+        node = GRAPH[stage]
+        if node.input == END:
+            break
+        value = choose_answer(scenario, node)
+        started = time.perf_counter()
+        driver.answer(node, value)
+        if at.exception:
+            raise RuntimeError(f"stage {stage!r}: {at.exception[0].value}")
+        if _session(at)["stage"] == stage:
+            # html 模式下个别阶段需要再运行一次才能前进
+            at.run()
+        action_ms.append((time.perf_counter() - started) * 1000)
+        next_stage = _session(at)["stage"]
+        if next_stage == stage:
+            raise RuntimeError(f"stage {stage!r} did not advance on {value!r}")
+        edges.update(_hops(stage, next_stage))
+        stage = next_stage
+    else:
+        raise RuntimeError(f"scenario {scenario_name!r} did not reach the end")
+
+    messages = _session(at)["messages"]
+    return {
+        "scenario": scenario_name,
+        "actions": len(action_ms),
+        "action_ms": action_ms,
+        "script_ms": [ms for ms, _ in _records],
+        "payload_bytes": [n for _, n in _records],
+        "messages": len(messages),
+        "render": render_cost(messages, os.environ["EHEALTH_LITE"] == "on", mode),
+        "edges": sorted(edges),
+        "pid": os.getpid(),
+        "rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+# ---------------- 汇总与基线 -----------------
+def graph_edges() -> set:
+    return {(node.id, b.next) for node in GRAPH.nodes.values() for b in node.branches}
+
+
+def run_benchmark(sessions: int, rounds: int, mode: str, scenarios: List[str], lite: bool = False) -> Dict:
+    jobs = [scenarios[i % len(scenarios)] for i in range(sessions * rounds)]
+    started = time.perf_counter()
+    # 按模块名引用任务函数：AppTest 运行后工作进程的 __main__ 变成了 app_strict.py，
+    # 以 python -m 启动时 __main__.run_session 在那里就找不到了
+    from ehealth import bench
+    with ProcessPoolExecutor(max_workers=sessions, initializer=bench._init_worker, initargs=(mode, lite)) as pool:
+        results = list(pool.map(bench.run_session, jobs))
+    wall = time.perf_counter() - started
+
+    script_ms = [ms for r in results for ms in r["script_ms"]]
+    action_ms = [ms for r in results for ms in r["action_ms"]]
+    payload = [n for r in results for n in r["payload_bytes"]]
+    rss = {}
+    for r in results:
+        rss[r["pid"]] = max(rss.get(r["pid"], 0), r["rss_kb"])
+    covered = {tuple(e) for r in results for e in r["edges"]}
+    all_edges = graph_edges()
+    return {
+        "meta": {
+            "mode": mode,
+            "lite": lite,
+            "sessions": sessions,
+            "rounds": rounds,
+            "scenarios": scenarios,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+        },
+        "wall_s": round(wall, 3),
+        "sessions_per_s": round(len(results) / wall, 3) if wall else 0.0,
+        "reruns_per_session": round(len(script_ms) / len(results), 3),
+        "actions_per_session": round(len(action_ms) / len(results), 3),
+        "script_ms": summarize(script_ms),
+        "action_ms": summarize(action_ms),
+        "payload_bytes": summarize(payload),
+        "payload_bytes_per_session": round(sum(payload) / len(results)),
+        "peak_rss_kb": max(rss.values()),
+        "render_per_session": {
+            key: round(sum(r["render"][key] for r in results) / len(results)) for key in results[0]["render"]
+        },
+        "branch_coverage": f"{len(covered & all_edges)}/{len(all_edges)}",
+        "uncovered": sorted(" -> ".join(e) for e in all_edges - covered),
+    }
+
+
+def _lookup(report: Dict, dotted: str) -> Optional[float]:
+    value = report
+    for part in dotted.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def compare(report: Dict, baseline: Dict) -> List[str]:
+    """返回超出容差的指标描述；为空表示没有回退。"""
+    regressions = []
+    for key, tolerance in TOLERANCE.items():
+        current, base = _lookup(report, key), _lookup(baseline, key)
+        if current is None or base is None:
+            continue
+        if current > base * (1 + tolerance):
+            regressions.append(f"{key}: {current} > baseline {base} (+{tolerance:.0%} allowed)")
+    return regressions
+
+
+def format_report(report: Dict) -> str:
+    meta = report["meta"]
+    lines = [
+        f"mode={meta['mode']}{' lite' if meta.get('lite') else ''} sessions={meta['sessions']} rounds={meta['rounds']} "
+        f"wall={report['wall_s']}s ({report['sessions_per_s']} sessions/s)",
+        f"reruns/session={report['reruns_per_session']} actions/session={report['actions_per_session']}",
+    ]
+    for key, unit in (("script_ms", "ms"), ("action_ms", "ms"), ("payload_bytes", "B")):
+        s = report[key]
+        lines.append(f"{key:<14} p50={s['p50']}{unit} p90={s['p90']}{unit} p99={s['p99']}{unit} "
+                     f"max={s['max']}{unit} mean={s['mean']}{unit}")
+    lines.append(f"payload/session={report['payload_bytes_per_session']}B peak_rss={report['peak_rss_kb']}KB")
+    lines.append("render/session " + " ".join(f"{k}={v}" for k, v in report["render_per_session"].items()))
+    lines.append(f"branch coverage={report['branch_coverage']}")
+    for edge in report["uncovered"]:
+        lines.append(f"  uncovered: {edge}")
+    return "\n".join(lines)
+
+
+def format_lite_comparison(default: Dict, lite: Dict) -> str:
+    """精简模式相对默认模式的下发字节和渲染成本。"""
+    rows = [("payload_bytes.mean", "payload mean"), ("payload_bytes_per_session", "payload/session")]
+    rows += [(f"render_per_session.{key}", key) for key in default["render_per_session"]]
+    lines = ["lite vs default"]
+    for key, label in rows:
+        base, value = _lookup(default, key), _lookup(lite, key)
+        change = f"{(value - base) / base:+.0%}" if base else "n/a"
+        lines.append(f"  {label:<16} {base} -> {value} ({change})")
+    return "\n".join(lines)
+
+
+# ---------------- HTTP/JSON 接口压测 -----------------
+async def _request(reader, writer, method: str, path: str, payload: Optional[Dict] = None):
+    body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+    )
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    data = await reader.readexactly(length)
+    if status >= 300:
+        raise RuntimeError(f"{method} {path}: {status} {data.decode('utf-8', 'replace')}")
+    return json.loads(data), len(data)
+
+
+async def _api_client(host: str, port: int, jobs: List[str], latency_ms: List[float], sizes: List[int]) -> int:
+    """一个长连接依次跑完分给它的会话，返回完成的会话数。"""
+    reader, writer = await asyncio.open_connection(host, port)
+    done = 0
+    try:
+        while jobs:
+            scenario = SCENARIOS_BY_NAME[jobs.pop()]
+            started = time.perf_counter()
+            view, size = await _request(reader, writer, "POST", "/sessions")
+            latency_ms.append((time.perf_counter() - started) * 1000)
+            sizes.append(size)
+            sid = view["sid"]
+            for _ in range(MAX_STEPS):
+                if view["finished"]:
+                    break
+                value = choose_answer(scenario, GRAPH[view["stage"]])
+                started = time.perf_counter()
+                view, size = await _request(reader, writer, "POST", f"/sessions/{sid}/answer", {"value": value})
+                latency_ms.append((time.perf_counter() - started) * 1000)
+                sizes.append(size)
+            else:
+                raise RuntimeError(f"scenario {scenario.name!r} did not reach the end")
+            await _request(reader, writer, "DELETE", f"/sessions/{sid}")
+            done += 1
+    finally:
+        writer.close()
+    return done
+
+
+def run_api_benchmark(url: str, total: int, concurrency: int, scenarios: List[str]) -> Dict:
+    """用 concurrency 个长连接对已启动的 API（python -m ehealth.api）跑完 total 个会话。"""
+    parsed = urlsplit(url)
+    jobs = [scenarios[i % len(scenarios)] for i in range(total)]
+    latency_ms: List[float] = []
+    sizes: List[int] = []
+
+    async def drive():
+        clients = [_api_client(parsed.hostname, parsed.port or 80, jobs, latency_ms, sizes) for _ in range(concurrency)]
+        return sum(await asyncio.gather(*clients))
+
+    started = time.perf_counter()
+    done = asyncio.run(drive())
+    wall = time.perf_counter() - started
+    return {
+        "meta": {"mode": "api", "url": url, "sessions": total, "concurrency": concurrency, "scenarios": scenarios},
+        "wall_s": round(wall, 3),
+        "sessions_per_s": round(done / wall, 1),
+        "requests_per_s": round(len(latency_ms) / wall, 1),
+        "request_ms": summarize(latency_ms),
+        "response_bytes": summarize(sizes),
+    }
+
+
+def format_api_report(report: Dict) -> str:
+    meta = report["meta"]
+    s = report["request_ms"]
+    return "\n".join([
+        f"api {meta['url']} sessions={meta['sessions']} concurrency={meta['concurrency']} wall={report['wall_s']}s",
+        f"{report['sessions_per_s']} sessions/s, {report['requests_per_s']} requests/s",
+        f"request_ms     p50={s['p50']}ms p90={s['p90']}ms p99={s['p99']}ms max={s['max']}ms",
+        f"response bytes mean={report['response_bytes']['mean']}B max={report['response_bytes']['max']}B",
+    ])
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m ehealth.bench", description=__doc__.split("\n")[0])
+    parser.add_argument("--sessions", type=int, default=len(SCENARIOS), help="parallel sessions (worker processes)")
+    parser.add_argument("--rounds", type=int, default=1, help="consultations per worker")
+    parser.add_argument("--mode", choices=("html", "component"), default="component")
+    parser.add_argument("--lite", choices=("off", "on", "both"), default="off",
+                        help="lite rendering mode; 'both' runs default and lite and compares them")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS_BY_NAME),
+                        help="restrict to these scenarios (default: all)")
+    parser.add_argument("--api", metavar="URL",
+                        help="drive a running JSON API (python -m ehealth.api) instead of the Streamlit app")
+    parser.add_argument("--concurrency", type=int, default=50, help="keep-alive connections in --api mode")
+    parser.add_argument("--json", metavar="PATH", help="write the full report as JSON")
+    parser.add_argument("--save", metavar="PATH", nargs="?", const="",
+                        help="save the report as a baseline (default: benchmarks/baseline-<mode>[-lite].json)")
+    parser.add_argument("--compare", metavar="PATH", nargs="?", const="",
+                        help="compare against a saved baseline; exit 1 on regression")
+    args = parser.parse_args(argv)
+    if args.lite == "both" and (args.save is not None or args.compare is not None):
+        parser.error("--save/--compare need a single run; use --lite off or --lite on")
+    for key in ("save", "compare"):
+        if getattr(args, key) == "":
+            setattr(args, key, default_baseline(args.mode, args.lite == "on"))
+
+    scenarios = args.scenario or [s.name for s in SCENARIOS]
+    if args.api:
+        if args.save or args.compare:
+            parser.error("--save/--compare apply to the Streamlit benchmark only")
+        if args.lite != "off":
+            parser.error("--lite applies to the Streamlit benchmark only")
+        report = run_api_benchmark(args.api, args.sessions * args.rounds, args.concurrency, scenarios)
+        print(format_api_report(report))
+    elif args.lite == "both":
+        default = run_benchmark(args.sessions, args.rounds, args.mode, scenarios)
+        print(format_report(default))
+        lite = run_benchmark(args.sessions, args.rounds, args.mode, scenarios, lite=True)
+        print(format_report(lite))
+        print(format_lite_comparison(default, lite))
+        report = {"default": default, "lite": lite}
+    else:
+        report = run_benchmark(args.sessions, args.rounds, args.mode, scenarios, lite=args.lite == "on")
+        print(format_report(report))
+
+    for path in filter(None, (args.json, args.save)):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        for key in ("mode", "lite"):
+            # 不同的渲染方式之间比较没有意义
+            recorded = baseline.get("meta", {}).get(key, False if key == "lite" else None)
+            if recorded != report["meta"][key]:
+                print(f"error: baseline {args.compare} was recorded with {key}={recorded}, "
+                      f"this run has {key}={report['meta'][key]}", file=sys.stderr)
+                return 2
+        for key in ("sessions", "rounds", "scenarios"):
+            recorded = baseline.get("meta", {}).get(key)
+            if recorded != report["meta"][key]:
+                print(f"warning: baseline {key}={recorded}, this run {report['meta'][key]}", file=sys.stderr)
+        regressions = compare(report, baseline)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            return 1
+        print(f"no regressions against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,46 @@
+"""声明式双向聊天组件（components.declare_component）。
+
+组件 iframe 使用固定 key，rerun 之间不会重新挂载：服务端每次只把对方还没有的
+消息片段作为参数下发，前端追加到 DOM；选项按钮和文本输入也在组件内渲染，
+用户操作通过组件返回值回传，不再需要轮询或 postMessage 触发 rerun。
+
+前端是 chat_frontend/index.html 中的纯 HTML/JS，不需要额外构建步骤。
+"""
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import streamlit.components.v1 as components
+
+
+_FRONTEND_DIR = Path(__file__).resolve().parent / "chat_frontend"
+_component = components.declare_component("ehealth_chat", path=str(_FRONTEND_DIR))
+
+COMPONENT_KEY = "chat"
+
+
+def chat_component(
+    epoch: int,
+    base: int,
+    played: int,
+    fragments: List[str],
+    options: List[str],
+    input_placeholder: Optional[str],
+    lite: bool = False,
+) -> Optional[Dict[str, Any]]:
+    """渲染聊天组件，返回前端最近一次回传的事件（可能是旧事件，需按挂载标识和 seq 去重）。
+
+    epoch 变化表示消息记录被清空重建；fragments 是从第 base 条开始的新消息 HTML，
+    其中第 played 条之后的是用户还没见过的新消息，前端按各自的延迟逐条播放。
+    lite 为 True 时前端换用 chat-lite.css 和扁平的按钮样式。
+    """
+    return _component(
+        epoch=epoch,
+        base=base,
+        played=played,
+        fragments=fragments,
+        options=options,
+        input=input_placeholder,
+        lite=lite,
+        key=COMPONENT_KEY,
+        default=None,
+    )
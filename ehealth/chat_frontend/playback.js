@@ -0,0 +1,59 @@
+/* 消息逐条出现：新消息先隐藏，按各自的 data-d（秒，对应 Message.delay）依次显示，
+   等待期间在消息下方显示“正在输入”指示器。计时完全在浏览器端，不触发 rerun。
+
+   组件模式由 index.html 引用；components.html 模式由 ehealth/chat_render.py 内联。 */
+function ChatPlayback(chat, onIdle) {
+    const queue = [];
+    let timer = null;
+
+    const typing = document.createElement('div');
+    typing.className = 'typing-indicator';
+    typing.hidden = true;
+    typing.innerHTML = '<span class="typing-dot"></span><span class="typing-dot"></span><span class="typing-dot"></span>';
+    chat.appendChild(typing);
+
+    function scrollToBottom() {
+        chat.scrollTop = chat.scrollHeight;
+    }
+
+    function step() {
+        timer = null;
+        while (queue.length) {
+            const el = queue[0];
+            const delay = parseFloat(el.dataset.d || '0');
+            if (delay > 0 && !el.dataset.waited) {
+                el.dataset.waited = '1';
+                typing.hidden = false;
+                scrollToBottom();
+                timer = setTimeout(step, delay * 1000);
+                return;
+            }
+            queue.shift();
+            el.hidden = false;
+        }
+        typing.hidden = true;
+        scrollToBottom();
+        if (onIdle) onIdle();
+    }
+
+    return {
+        // 排队播放新追加的消息元素；正在播放时接在队尾
+        play: function (elements) {
+            for (const el of elements) {
+                el.hidden = true;
+                queue.push(el);
+            }
+            if (timer === null) step();
+        },
+        // 消息记录被清空重建时丢弃尚未显示的消息
+        reset: function () {
+            clearTimeout(timer);
+            timer = null;
+            queue.length = 0;
+            typing.hidden = true;
+        },
+        busy: function () {
+            return timer !== null;
+        },
+    };
+}
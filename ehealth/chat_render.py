@@ -0,0 +1,246 @@
+"""聊天记录的 HTML 渲染。
+
+样式集中在 chat_frontend/chat.css，消息片段只引用短类名；样式表和页面模板在 import
+时压缩一次。每条消息渲染出的 HTML 片段按 (序号, 内容哈希) 缓存在会话里，rerun 时
+只渲染新追加的消息。
+
+精简模式（低带宽/低端手机）使用 chat-lite.css 和 render_message_lite：纯色、无动画、
+无头像、不按延迟播放，components.html 页面也不带脚本。
+"""
+import itertools
+import re
+import sys
+from pathlib import Path
+from typing import Callable, List, Mapping, Optional, Tuple
+
+from ehealth.asset_cache import asset_cache
+from ehealth.asset_pipeline import pamphlet_variants
+from ehealth.messages import Message
+from ehealth.metrics import phase
+from ehealth.static_assets import static_serving_enabled, static_url, url_for
+
+
+# ---------------- 图片 -----------------
+def to_data_url(image_path: str) -> Optional[str]:
+    """将本地图片路径转换为 base64 data URL，便于在自定义组件 iframe 中稳定显示。
+
+    结果由进程级缓存（ehealth/asset_cache.py）按路径 + mtime/size 复用，所有会话共享。"""
+    with phase("to_data_url"):
+        return asset_cache.data_url(image_path)
+
+
+def image_src(image_path: str) -> str:
+    """优先使用静态资源 URL（浏览器可长期缓存），静态服务不可用时回退到内联 data URL。"""
+    return static_url(image_path) or to_data_url(image_path) or image_path
+
+
+def image_html(image_path: str, caption: str) -> str:
+    """生成图片标签：优先使用缩放后的 WebP/PNG 变体（1x/2x srcset），不可用时回退到原图。"""
+    variants = pamphlet_variants(image_path)
+    if variants is None:
+        return f'<img class="pi" src="{image_src(image_path)}" alt="{caption}">'
+    if static_serving_enabled():
+        def srcset(vs):
+            return ", ".join(f"{url_for(v.path.name, variants.version)} {v.density}x" for v in vs)
+
+        fallback = url_for(variants.png[0].path.name, variants.version)
+        return (
+            f'<picture><source type="image/webp" srcset="{srcset(variants.webp)}">'
+            f'<img class="pi" src="{fallback}" srcset="{srcset(variants.png)}" alt="{caption}"></picture>'
+        )
+    # 无静态服务时只内联 1x WebP，体积仅为原图的几个百分点
+    src = to_data_url(str(variants.webp[0].path)) or image_src(image_path)
+    return f'<img class="pi" src="{src}" alt="{caption}">'
+
+
+def lite_image_html(image_path: str, caption: str) -> str:
+    """精简模式只用 1x WebP，并延迟到滚动到附近时再加载。"""
+    variants = pamphlet_variants(image_path)
+    if variants is None:
+        src = image_src(image_path)
+    elif static_serving_enabled():
+        src = url_for(variants.webp[0].path.name, variants.version)
+    else:
+        src = to_data_url(str(variants.webp[0].path)) or image_src(image_path)
+    return f'<img class="pi" loading="lazy" src="{src}" alt="{caption}">'
+
+
+# ---------------- 样式 -----------------
+# 全部样式在 chat_frontend/chat.css 中，消息 HTML 只带短类名；模板在 import 时压缩一次
+FRONTEND_DIR = Path(__file__).resolve().parent / "chat_frontend"
+STYLESHEET = FRONTEND_DIR / "chat.css"
+LITE_STYLESHEET = FRONTEND_DIR / "chat-lite.css"
+PLAYBACK_SCRIPT = FRONTEND_DIR / "playback.js"
+
+
+def minify_css(css: str) -> str:
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,>])\s*", r"\1", css)
+    css = re.sub(r":\s+", ":", css)
+    return css.replace(";}", "}").strip()
+
+
+def minify_html(html: str) -> str:
+    """去掉每行缩进、整行注释和标签间空白；按行连接，脚本靠换行断句不受影响。"""
+    lines = (line.strip() for line in html.splitlines())
+    html = "\n".join(line for line in lines if line and not line.startswith("//"))
+    return re.sub(r">\s+<", "><", html)
+
+
+CHAT_CSS = minify_css(STYLESHEET.read_text(encoding="utf-8"))
+CHAT_LITE_CSS = minify_css(LITE_STYLESHEET.read_text(encoding="utf-8"))
+PLAYBACK_JS = minify_html(re.sub(r"/\*.*?\*/", "", PLAYBACK_SCRIPT.read_text(encoding="utf-8"), flags=re.S))
+
+AVATARS = {"doctor": "🩺", "receptionist": "🧑‍💼"}
+
+
+def render_message(i: int, m: Message) -> str:
+    """渲染单条消息为 HTML 片段：患者消息靠右（.r），其余角色靠左（.l）。"""
+    role = m.role
+    avatar_box = f'<div class="av">{AVATARS.get(role, "🙂")}</div>'
+    if m.type == "image":
+        caption = m.caption
+        content = image_html(m.image_path, caption)
+        if caption:
+            content += f'<div class="cap">{caption}</div>'
+    else:
+        content = m.text.lstrip()
+    column = f'<div class="w"><div class="rl">{role.capitalize()}</div><div class="b">{content}</div></div>'
+    # 前端按 data-d 的秒数延迟显示（playback.js），无延迟的消息不带该属性
+    delay = f' data-d="{m.delay:g}"' if m.delay else ""
+    if role == "patient":
+        return f'<div class="m r"{delay}>{column}{avatar_box}</div>'
+    return f'<div class="m l"{delay}>{avatar_box}{column}</div>'
+
+
+def render_message_lite(i: int, m: Message) -> str:
+    """精简模式：一条消息一个元素，角色名在 <b> 里；不带延迟，前端收到即显示。"""
+    if m.type == "image":
+        content = lite_image_html(m.image_path, m.caption)
+        if m.caption:
+            content += f"<i>{m.caption}</i>"
+    else:
+        content = m.text.lstrip()
+    side = "r" if m.role == "patient" else "l"
+    return f'<div class="{side}"><b>{m.role.capitalize()}</b>{content}</div>'
+
+
+def prefers_lite(headers: Mapping[str, str]) -> bool:
+    """按请求头自动选择精简模式：浏览器开启了省流量（Save-Data）、网络很慢（ECT），或是手机。"""
+    def header(name: str) -> str:
+        return (headers.get(name) or "").lower()
+
+    return (
+        header("Save-Data") == "on"
+        or header("ECT") in ("slow-2g", "2g", "3g")
+        or header("Sec-CH-UA-Mobile") == "?1"
+        or "mobi" in header("User-Agent")
+    )
+
+
+def message_key(i: int, m: Message) -> Tuple[int, int]:
+    return i, hash(m.key())
+
+
+# 进程内唯一的重建序号，前端据此判断是否需要清空已显示的消息
+_epochs = itertools.count(1)
+
+
+class FragmentCache:
+    """单个会话的消息片段缓存。
+
+    消息列表只会追加或整体清空，因此只需校验已缓存前缀的最后一条：一致则只渲染
+    新增消息，不一致（例如回到首页后重新开始）则整体重建，并换一个新的 epoch。
+    会话被换出时 release() 只丢掉 HTML，保留消息键和 epoch，下次渲染得到相同的片段。
+    """
+
+    __slots__ = ("renderer", "keys", "fragments", "html", "rendered", "epoch")
+
+    def __init__(self, renderer: Callable[[int, Message], str] = render_message):
+        self.renderer = renderer
+        self.keys: List[Tuple[int, int]] = []
+        self.fragments: List[str] = []
+        self.html = ""
+        self.rendered = 0  # 累计实际渲染的消息条数，便于观察命中情况
+        self.epoch = next(_epochs)
+
+    def _prefix_valid(self, messages: List[Message]) -> bool:
+        n = len(self.keys)
+        if n > len(messages):
+            return False
+        return n == 0 or message_key(n - 1, messages[n - 1]) == self.keys[-1]
+
+    def render(self, messages: List[Message]) -> str:
+        if not self._prefix_valid(messages):
+            self.keys, self.fragments, self.html = [], [], ""
+            self.epoch = next(_epochs)
+        start = len(self.fragments)  # release() 之后小于 len(self.keys)
+        if start < len(messages):
+            new = []
+            for i in range(start, len(messages)):
+                m = messages[i]
+                if i >= len(self.keys):
+                    self.keys.append(message_key(i, m))
+                new.append(self.renderer(i, m))
+            self.fragments.extend(new)
+            self.html += "".join(new)
+            self.rendered += len(new)
+        return self.html
+
+    def release(self) -> None:
+        self.fragments, self.html = [], ""
+
+    def nbytes(self) -> int:
+        """缓存的 HTML 占用的内存（内联图片时主要是 base64 数据）。"""
+        return sys.getsizeof(self.html) + sum(map(sys.getsizeof, self.fragments)) + 64 * len(self.keys)
+
+
+# ---------------- 页面模板 -----------------
+def _stylesheet_tag(css: str) -> str:
+    """样式表内联在页面里：Streamlit 的静态服务把 .css 当作 text/plain（加 nosniff）下发，
+    浏览器不会应用这样的外链样式表。"""
+    return f"<style>{css}</style>"
+
+
+CHAT_HEAD = minify_html(f"""
+<style>#chat-container{{height:75vh}}</style>
+{_stylesheet_tag(CHAT_CSS)}
+<div id="chat-container">
+    <div id="messages-container">
+""")
+
+CHAT_TAIL = minify_html("""
+    </div>
+</div>
+<script>__PLAYBACK_JS__</script>
+<script>
+    const chat = document.getElementById('chat-container');
+    const messages = document.getElementById('messages-container');
+    // 图片加载完成后高度变化，保持滚动到底部
+    messages.addEventListener('load', function () {
+        chat.scrollTop = chat.scrollHeight;
+    }, true);
+    // 上次渲染时已经显示过的消息直接出现，其后的新消息按各自的延迟逐条播放
+    ChatPlayback(chat).play(Array.prototype.slice.call(messages.children, __PLAYED__));
+</script>
+""").replace("__PLAYBACK_JS__", PLAYBACK_JS)
+
+
+def chat_page(messages_html: str, played: int) -> str:
+    """完整的 components.html 页面；played 为此前已经显示给用户的消息条数。"""
+    return CHAT_HEAD + messages_html + CHAT_TAIL.replace("__PLAYED__", str(played))
+
+
+CHAT_LITE_HEAD = minify_html(f"""
+<style>#chat-container{{height:75vh}}</style>
+{_stylesheet_tag(CHAT_LITE_CSS)}
+<div id="chat-container">
+    <div id="messages-container">
+""")
+CHAT_LITE_TAIL = "</div></div>"
+
+
+def chat_page_lite(messages_html: str) -> str:
+    """精简模式的 components.html 页面：没有脚本，滚动位置由 CSS 保持在底部。"""
+    return CHAT_LITE_HEAD + messages_html + CHAT_LITE_TAIL
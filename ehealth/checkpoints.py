@@ -0,0 +1,66 @@
+"""会话检查点：服务重启后凭 URL 中的恢复令牌接着问诊。
+
+默认的内存会话存储在进程重启时清空，患者只能从 receptionist_welcome 重新开始。
+开启检查点后（默认开启），sid 作为恢复令牌放进 URL（?sid=...），每当会话进入新的
+阶段就把紧凑编码的状态（stage + profile + 消息的文本下标，见 session_store.encode）
+写入本地 SQLite 文件；新连接带着令牌到来而内存中没有这个会话时，直接解码检查点
+恢复，不重放剧本，耗时与对话进度无关。
+
+会话存储本身已是共享/持久的（sqlite、redis）时不需要再单独写检查点。
+
+检查点含姓名、健康回答和完整对话记录，不长期保留：问诊走完并提交后即删除，
+超过 EHEALTH_CHECKPOINT_MAX_AGE_HOURS（默认 72 小时）没有更新的检查点定期清理。
+
+- EHEALTH_CHECKPOINTS=0 关闭；
+- EHEALTH_CHECKPOINT_PATH 指定数据库文件，默认 data/checkpoints.db。
+"""
+import os
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from ehealth.asset_cache import APP_DIR
+from ehealth.session_store import STORE as SESSION_STORE, ConflictError, Loaded, SqliteStore
+
+
+ENABLED = os.environ.get("EHEALTH_CHECKPOINTS", "1") not in ("", "0") and not SESSION_STORE.shared
+CHECKPOINT_PATH = Path(os.environ.get("EHEALTH_CHECKPOINT_PATH", "") or APP_DIR / "data" / "checkpoints.db")
+MAX_AGE = float(os.environ.get("EHEALTH_CHECKPOINT_MAX_AGE_HOURS", "72")) * 3600
+PURGE_INTERVAL = 3600  # 两次清理之间至少间隔的秒数
+
+_store: Optional[SqliteStore] = SqliteStore(CHECKPOINT_PATH) if ENABLED else None
+_purged_at = float("-inf")
+
+
+def restore(sid: str) -> Optional[Loaded]:
+    """按令牌读取检查点；没有、或由不兼容的剧本版本写入时返回 None。"""
+    if _store is None:
+        return None
+    return _store.load(sid)
+
+
+def save(sid: str, state: Dict, last: Optional[Loaded]) -> Optional[Loaded]:
+    """写入检查点，返回新的 Loaded（供下次比较）。"""
+    if _store is None:
+        return None
+    purge()
+    try:
+        return _store.save(sid, state, last)
+    except ConflictError:
+        # 同一令牌在另一个标签页里也推进了：以最后写入者为准
+        return _store.save(sid, state, _store.load(sid))  # 无法解码的记录在 load 时已删除
+
+
+def discard(sid: str) -> None:
+    if _store is not None:
+        _store.delete(sid)
+
+
+def purge(force: bool = False) -> int:
+    """清理过期的检查点；距上次清理不足 PURGE_INTERVAL 时不做（force 除外）。"""
+    global _purged_at
+    now = time.monotonic()
+    if _store is None or (not force and now - _purged_at < PURGE_INTERVAL):
+        return 0
+    _purged_at = now
+    return _store.purge(MAX_AGE)
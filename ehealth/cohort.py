@@ -0,0 +1,204 @@
+"""问诊 profile 的定长编码与队列统计。
+
+profile 是约 30 个字符串/None 字段的字典，按钮回答存的是原始标签（"3-5 days per week"）。
+这里按剧本生成固定宽度的记录格式（NumPy 结构化 dtype，每个字段一个 uint8）：
+
+- 按钮字段：枚举，0 = 未回答，1.. = 该阶段选项的顺序；
+- 多选字段（topics）：位掩码，第 i 位对应第 i 个选项；
+- 就业状态、压力/睡眠分数：同样编码为枚举（分数按量表范围逐个取值）。
+
+自由文本（姓名、职业原文等）不进入记录，所以导出文件不含可识别个人的内容。
+
+已完成的问诊可以导出为列存文件（每个字段一个数组的 .npz），再对任意几个字段做交叉表
+（ravel_multi_index + bincount，几十万人也只需一次扫描）::
+
+    python -m ehealth.cohort export data/consultations.db -o data/cohort.npz
+    python -m ehealth.cohort crosstab data/cohort.npz exercise_freq sleep_quality_1_5 work_stress
+
+crosstab 也可以直接读 .db / .jsonl（现场编码）。
+"""
+import argparse
+import json
+import sys
+import time
+from math import prod
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+
+from ehealth.dialogue import BUTTONS, DialogueGraph
+from ehealth.engine import new_profile
+from ehealth.normalize import EMPLOYMENT_STATUSES, SCORES, iter_records, normalize_profile
+from ehealth.script import GRAPH
+
+
+MISSING = "-"  # 交叉表中编码 0 的标签
+
+
+class Field(NamedTuple):
+    name: str
+    values: Tuple  # 编码 i 对应 values[i - 1]
+    flags: bool = False  # 多选字段：第 i 位对应 values[i]
+
+
+def build_schema(graph: DialogueGraph = GRAPH) -> Tuple[Field, ...]:
+    """按剧本的按钮选项和规范化字段生成记录格式；字段顺序与 new_profile() 一致。"""
+    profile = new_profile()
+    values: Dict[str, List] = {}
+    for node in graph.nodes.values():
+        if node.input == BUTTONS and node.profile_key:
+            labels = values.setdefault(node.profile_key, [])
+            labels.extend(label for label in (o.strip("[] ") for o in node.options) if label not in labels)
+    values["employment_status"] = list(EMPLOYMENT_STATUSES)
+    for key, (low, high) in SCORES.items():
+        values[key] = list(range(low, high + 1))
+    fields = []
+    for key in profile:
+        if key not in values:
+            continue
+        field = Field(key, tuple(values[key]), isinstance(profile[key], list))
+        if len(field.values) > (8 if field.flags else 255):
+            raise ValueError(f"profile field {key!r} has too many values for one byte")
+        fields.append(field)
+    return tuple(fields)
+
+
+SCHEMA = build_schema()
+DTYPE = np.dtype([(field.name, np.uint8) for field in SCHEMA])
+# (字段, {取值: 编码}, 是否多选)；多选字段的编码是位
+_CODES = [
+    (field.name, {value: (1 << i if field.flags else i + 1) for i, value in enumerate(field.values)}, field.flags)
+    for field in SCHEMA
+]
+
+
+def encode_row(profile: Dict) -> bytes:
+    """profile -> 一条定长记录（每个字段一字节）；未回答和不在选项里的值记为 0。"""
+    get = profile.get
+    return bytes([
+        sum(codes.get(v, 0) for v in get(name) or ()) if flags else codes.get(get(name), 0)
+        for name, codes, flags in _CODES
+    ])
+
+
+def encode(profiles: Iterable[Dict]) -> np.ndarray:
+    # 拼接字节再整体解释成结构化数组，比逐行构造元组快
+    return np.frombuffer(bytearray(b"".join([encode_row(profile) for profile in profiles])), dtype=DTYPE)
+
+
+def decode_row(record) -> Dict:
+    profile = {}
+    for field in SCHEMA:
+        code = int(record[field.name])
+        if field.flags:
+            profile[field.name] = [v for i, v in enumerate(field.values) if code >> i & 1]
+        else:
+            profile[field.name] = field.values[code - 1] if code else None
+    return profile
+
+
+# ---------------- 列存导出 -----------------
+def save(path: Path, records: np.ndarray, schema: Sequence[Field] = SCHEMA) -> None:
+    """每个字段一个数组；记录格式以 JSON 存在 __schema__ 里，旧导出在剧本改动后仍能解读。"""
+    columns = {field.name: np.ascontiguousarray(records[field.name]) for field in schema}
+    np.savez_compressed(path, __schema__=np.array(json.dumps([list(field) for field in schema])), **columns)
+
+
+def load(path: Path) -> Tuple[Dict[str, Field], Dict[str, np.ndarray]]:
+    with np.load(path, allow_pickle=False) as data:
+        schema = {name: Field(name, tuple(values), flags) for name, values, flags in json.loads(str(data["__schema__"]))}
+        return schema, {name: data[name] for name in schema}
+
+
+def load_columns(path: Path) -> Tuple[Dict[str, Field], Dict[str, np.ndarray]]:
+    """.npz 直接读取；.db / .jsonl 现场规范化并编码。"""
+    if path.suffix == ".npz":
+        return load(path)
+    records = encode(normalize_profile(record["profile"]) for record in iter_records(path))
+    return {field.name: field for field in SCHEMA}, {field.name: records[field.name] for field in SCHEMA}
+
+
+# ---------------- 交叉表 -----------------
+def crosstab(schema: Dict[str, Field], columns: Dict[str, np.ndarray], names: Sequence[str]) -> np.ndarray:
+    """返回计数数组，第 k 维对应 names[k]，下标 0 是未回答。"""
+    shape = []
+    for name in names:
+        field = schema.get(name)
+        if field is None:
+            raise ValueError(f"unknown field {name!r}; choose from {', '.join(schema)}")
+        if field.flags:
+            raise ValueError(f"{name!r} is a multiple-choice field and cannot be cross-tabulated")
+        shape.append(len(field.values) + 1)
+    index = np.ravel_multi_index([columns[name] for name in names], shape)
+    return np.bincount(index, minlength=prod(shape)).reshape(shape)
+
+
+def _labels(field: Field, skip: int = 0) -> List[str]:
+    return ([MISSING] + [str(value) for value in field.values])[skip:]
+
+
+def format_table(schema: Dict[str, Field], names: Sequence[str], counts: np.ndarray, share: bool,
+                 skip: int = 0) -> str:
+    """两个字段时输出二维表；更多字段时每个非零格一行。skip=1 表示 counts 已去掉未回答的一格。"""
+    total = int(counts.sum())
+
+    def cell(n) -> str:
+        return f"{n / total:.1%}" if share and total else str(int(n))
+
+    if len(names) == 2:
+        rows, cols = _labels(schema[names[0]], skip), _labels(schema[names[1]], skip)
+        head = f"{names[0]} \\ {names[1]}"
+        width = max(len(head), *(len(label) for label in rows))
+        widths = [max(len(label), 7) for label in cols]
+        lines = [head.ljust(width) + "".join(f"  {label:>{w}}" for label, w in zip(cols, widths)) + "    total"]
+        for i, label in enumerate(rows):
+            lines.append(label.ljust(width) + "".join(f"  {cell(n):>{w}}" for n, w in zip(counts[i], widths))
+                         + f"  {cell(counts[i].sum()):>7}")
+        return "\n".join(lines)
+    labels = [_labels(schema[name], skip) for name in names]
+    lines = ["\t".join(list(names) + ["count"])]
+    for index in zip(*np.nonzero(counts)):
+        lines.append("\t".join([labels[k][i] for k, i in enumerate(index)] + [cell(counts[index])]))
+    return "\n".join(lines)
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m ehealth.cohort", description=__doc__.split("\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="encode consultations into a columnar .npz file")
+    export.add_argument("paths", nargs="+", type=Path, help="consultations .db or .jsonl files")
+    export.add_argument("-o", "--output", type=Path, required=True, help="output .npz file")
+    table = commands.add_parser("crosstab", help="count participants by combinations of answers")
+    table.add_argument("path", type=Path, help="exported .npz, or consultations .db / .jsonl")
+    table.add_argument("fields", nargs="+", help="profile fields, e.g. exercise_freq sleep_quality_1_5")
+    table.add_argument("--answered", action="store_true", help="only count participants who answered every field")
+    table.add_argument("--share", action="store_true", help="print shares of the total instead of counts")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    if args.command == "export":
+        records = np.concatenate([encode(normalize_profile(r["profile"]) for r in iter_records(path)) for path in args.paths])
+        save(args.output, records)
+        print(f"exported {len(records)} consultations ({DTYPE.itemsize} bytes each) to {args.output} "
+              f"in {time.perf_counter() - started:.3f}s", file=sys.stderr)
+        return 0
+
+    schema, columns = load_columns(args.path)
+    loaded = time.perf_counter()
+    try:
+        counts = crosstab(schema, columns, args.fields)
+    except ValueError as exc:
+        parser.error(str(exc))
+    if args.answered:
+        counts = counts[(slice(1, None),) * counts.ndim]
+    elapsed = time.perf_counter() - loaded
+    print(format_table(schema, args.fields, counts, args.share, skip=int(args.answered)))
+    participants = len(next(iter(columns.values()))) if columns else 0
+    print(f"{participants} participants, {counts.size} cells; loaded in {loaded - started:.3f}s, "
+          f"counted in {elapsed:.3f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,209 @@
+"""已完成问诊的异步落盘（write-behind）。
+
+问诊走到 end 阶段时，UI 线程只把 profile 副本和消息元组放进进程级队列就返回；
+后台线程按批（最多 BATCH_SIZE 条，或等待 FLUSH_INTERVAL 秒）写入存储，每批一次
+提交，大量患者同时结束也不会让脚本运行等待磁盘 I/O。
+
+存储由 EHEALTH_STORE 选择：
+
+- sqlite（默认）：WAL 模式的 SQLite 数据库，consultations 表每行一次问诊；
+- jsonl：每行一个 JSON 记录的追加文件，超过 JSONL_ROTATE_BYTES 时轮转；
+- off：不落盘。
+
+EHEALTH_STORE_PATH 可指定文件路径，默认在应用目录的 data/ 下。
+"""
+import atexit
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from ehealth.asset_cache import APP_DIR
+from ehealth.messages import Message
+from ehealth.metrics import REGISTRY
+
+
+STORE_KIND = os.environ.get("EHEALTH_STORE", "sqlite")
+STORE_PATH = os.environ.get("EHEALTH_STORE_PATH", "")
+DATA_DIR = APP_DIR / "data"
+if STORE_KIND not in ("sqlite", "jsonl", "off"):
+    raise ValueError(f"unknown EHEALTH_STORE {STORE_KIND!r}")
+
+BATCH_SIZE = 200
+FLUSH_INTERVAL = 0.5  # 秒；凑不满一批时最多等这么久
+JSONL_ROTATE_BYTES = 64 * 1024 * 1024
+RETRY_DELAY = 1.0  # 写入失败后重试前的等待（秒）
+
+
+def record_row(record: Dict) -> Dict:
+    """在后台线程里把消息元组展开成可读文本。"""
+    transcript = []
+    for data in record["messages"]:
+        m = Message.from_tuple(data)
+        transcript.append({"role": m.role, "text": m.content, "image": m.image_path})
+    return {
+        "id": record["id"],
+        "session": record["session"],
+        "finished_at": record["finished_at"],
+        "profile": record["profile"],
+        "transcript": transcript,
+    }
+
+
+class SqliteSink:
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS consultations ("
+            " id TEXT PRIMARY KEY, session TEXT, finished_at REAL,"
+            " profile TEXT NOT NULL, transcript TEXT NOT NULL)"
+        )
+        self.conn.commit()
+
+    def write(self, rows: List[Dict]) -> None:
+        with self.conn:  # 一批一个事务
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO consultations VALUES (?, ?, ?, ?, ?)",
+                [
+                    (r["id"], r["session"], r["finished_at"],
+                     json.dumps(r["profile"], ensure_ascii=False),
+                     json.dumps(r["transcript"], ensure_ascii=False))
+                    for r in rows
+                ],
+            )
+
+
+class JsonlSink:
+    def __init__(self, path: Path, rotate_bytes: int = JSONL_ROTATE_BYTES):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.rotate_bytes = rotate_bytes
+        self.file = open(path, "a", encoding="utf-8")
+
+    def format(self, rows: List[Dict]) -> str:
+        return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in rows)
+
+    def write(self, rows: List[Dict]) -> None:
+        self.file.write(self.format(rows))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        if self.file.tell() >= self.rotate_bytes:
+            self.rotate()
+
+    def rotate(self) -> None:
+        self.file.close()
+        os.replace(self.path, self.path.with_name(f"{self.path.stem}-{time.strftime('%Y%m%d-%H%M%S')}{self.path.suffix}"))
+        self.file = open(self.path, "a", encoding="utf-8")
+
+
+def open_sink(kind: str = STORE_KIND, path: str = STORE_PATH):
+    if kind == "sqlite":
+        return SqliteSink(Path(path) if path else DATA_DIR / "consultations.db")
+    return JsonlSink(Path(path) if path else DATA_DIR / "consultations.jsonl")
+
+
+class WriteBehindQueue:
+    """进程级写队列；sink 在后台线程里创建（sqlite 连接不能跨线程使用）。prepare 在后台线程里
+    把登记的记录转换成 sink 的行。"""
+
+    def __init__(self, sink_factory, batch_size: int = BATCH_SIZE, interval: float = FLUSH_INTERVAL,
+                 prepare: Callable[[Dict], Dict] = record_row, name: str = "consultations"):
+        self._sink_factory = sink_factory
+        self._prepare = prepare
+        self.name = name
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue: "queue.SimpleQueue[Dict]" = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._idle = threading.Condition(self._lock)
+        self.pending = 0
+        self.written = 0
+        self.batches = 0
+        self.errors = 0
+
+    def submit(self, record: Dict) -> None:
+        """非阻塞：只入队，必要时启动后台线程。"""
+        with self._lock:
+            self.pending += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"ehealth-{self.name}", daemon=True)
+                self._thread.start()
+        self._queue.put(record)
+
+    def _next_batch(self) -> List[Dict]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        sink = None
+        while True:
+            rows = [self._prepare(r) for r in self._next_batch()]
+            while True:
+                try:
+                    if sink is None:
+                        sink = self._sink_factory()
+                    sink.write(rows)
+                    break
+                except Exception as exc:  # 磁盘满、数据库被锁等：保留这一批，稍后重试
+                    with self._lock:
+                        self.errors += 1
+                    print(f"ehealth: failed to persist {len(rows)} {self.name}: {exc}", file=sys.stderr)
+                    sink = None
+                    time.sleep(RETRY_DELAY)
+            with self._lock:
+                self.pending -= len(rows)
+                self.written += len(rows)
+                self.batches += 1
+                self._idle.notify_all()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """等待队列写空（进程退出时调用）；超时返回 False。"""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while self.pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"pending": self.pending, "written": self.written, "batches": self.batches, "errors": self.errors}
+
+
+store = WriteBehindQueue(open_sink)
+atexit.register(store.flush)
+REGISTRY.add_collector(lambda: {f"consultations_{k}": v for k, v in store.stats().items()})
+
+
+def submit(session: str, profile: Dict, messages: List[Message]) -> None:
+    """登记一次已完成的问诊；只在调用线程里做浅拷贝，序列化和写盘都在后台完成。"""
+    if STORE_KIND == "off":
+        return
+    store.submit({
+        "id": uuid.uuid4().hex,
+        "session": session,
+        "finished_at": time.time(),
+        "profile": {k: list(v) if isinstance(v, list) else v for k, v in profile.items()},
+        "messages": [m.to_tuple() for m in messages],
+    })
@@ -0,0 +1,164 @@
+"""数据驱动的对话图引擎。
+
+问诊脚本由 ehealth/script.py 中的节点列表描述：每个节点（即一个 stage）给出进入时
+要说的话、输入方式、选项、写入 profile 的字段，以及按选项/谓词分支的回复和下一阶段。
+节点在 import 时建成按 stage 名索引的字典，按钮选项另建 (stage, 选项) -> 分支 的索引，
+每次 rerun 的分发都是 O(1)；同时校验悬空跳转和不可达阶段，脚本有误时启动即失败。
+"""
+import html
+from collections import deque
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+
+# 节点输入方式
+BUTTONS = "buttons"  # 选项按钮
+TEXT = "text"        # 自由文本
+AUTO = "auto"        # 只说话，不等待输入，直接进入下一阶段
+END = "end"          # 终止节点
+
+# 回复文本中的占位符，替换为患者的回答（如 "{answer}, nice to meet you."）
+ANSWER = "{answer}"
+
+
+class ScriptError(ValueError):
+    """对话脚本结构错误（悬空跳转、不可达阶段、选项没有分支等）。"""
+
+
+class Say(NamedTuple):
+    role: str
+    text: str  # 图片消息时为图片说明
+    delay: float = 0
+    image: Optional[str] = None  # 图片路径，非空表示图片消息
+
+
+class Branch(NamedTuple):
+    next: str
+    say: Tuple[Say, ...] = ()
+    on: Optional[str] = None  # 按钮选项；None 表示按谓词/默认匹配
+    when: Optional[Callable[[str, dict], bool]] = None  # 谓词 (回答, profile) -> bool
+
+
+class Node(NamedTuple):
+    id: str
+    input: str
+    prompt: Tuple[Say, ...] = ()  # 进入阶段时说的话，每个会话只说一次
+    options: Tuple[str, ...] = ()
+    branches: Tuple[Branch, ...] = ()
+    profile_key: Optional[str] = None  # 回答写入 profile 的字段
+    placeholder: str = "[answer input]"
+    echo: str = "[{answer}]"  # 患者回答在聊天中的显示格式（按钮直接显示选项文字）
+    normalize: Optional[Callable[[str], dict]] = None  # 文本回答 -> 带类型的 profile 字段（见 ehealth/normalize.py）
+    compose: Optional[Callable[[dict], Tuple["Say", ...]]] = None  # 按 profile 生成、紧跟 prompt 说的话（见 ehealth/advice.py）
+
+
+class DialogueGraph:
+    def __init__(self, nodes: Iterable[Node], start: str):
+        self.start = start
+        self.nodes: Dict[str, Node] = {}
+        for node in nodes:
+            if node.id in self.nodes:
+                raise ScriptError(f"duplicate stage {node.id!r}")
+            self.nodes[node.id] = node
+        self._routes: Dict[Tuple[str, str], Branch] = {
+            (node.id, b.on): b
+            for node in self.nodes.values()
+            for b in node.branches
+            if b.on is not None
+        }
+        self.validate()
+
+    def __getitem__(self, stage: str) -> Node:
+        return self.nodes[stage]
+
+    def __contains__(self, stage: str) -> bool:
+        return stage in self.nodes
+
+    def _fallback(self, node: Node, answer: str, profile: dict) -> Optional[Branch]:
+        for b in node.branches:
+            if b.on is None and (b.when is None or b.when(answer, profile)):
+                return b
+        return None
+
+    def route(self, node: Node, answer: Optional[str], profile: dict) -> Branch:
+        """按回答选出分支：先查选项索引，再依次尝试谓词分支和默认分支。"""
+        branch = self._routes.get((node.id, answer))
+        if branch is None:
+            branch = self._fallback(node, answer, profile)
+        if branch is None:
+            raise ScriptError(f"stage {node.id!r} has no branch for answer {answer!r}")
+        return branch
+
+    def validate(self) -> None:
+        if self.start not in self.nodes:
+            raise ScriptError(f"start stage {self.start!r} is not defined")
+        for node in self.nodes.values():
+            if node.input not in (BUTTONS, TEXT, AUTO, END):
+                raise ScriptError(f"stage {node.id!r} has unknown input type {node.input!r}")
+            if node.input == END:
+                if node.branches:
+                    raise ScriptError(f"end stage {node.id!r} must not have branches")
+                continue
+            if not node.branches:
+                raise ScriptError(f"stage {node.id!r} has no branches")
+            for b in node.branches:
+                if b.next not in self.nodes:
+                    raise ScriptError(f"stage {node.id!r} jumps to undefined stage {b.next!r}")
+                if b.on is not None and b.on not in node.options:
+                    raise ScriptError(f"stage {node.id!r} routes unknown option {b.on!r}")
+            has_default = any(b.on is None and b.when is None for b in node.branches)
+            if node.input == BUTTONS:
+                if not node.options:
+                    raise ScriptError(f"button stage {node.id!r} has no options")
+                unrouted = [o for o in node.options if (node.id, o) not in self._routes]
+                if unrouted and not has_default:
+                    raise ScriptError(f"stage {node.id!r} has no branch for options {unrouted}")
+            elif not has_default:
+                raise ScriptError(f"stage {node.id!r} needs a default branch")
+            if node.normalize is not None and node.input != TEXT:
+                raise ScriptError(f"stage {node.id!r} normalizes a non-text answer")
+
+        unreachable = set(self.nodes) - self.reachable()
+        if unreachable:
+            raise ScriptError(f"unreachable stages: {sorted(unreachable)}")
+
+    def reachable(self) -> set:
+        seen = {self.start}
+        queue = deque([self.start])
+        while queue:
+            for b in self.nodes[queue.popleft()].branches:
+                if b.next not in seen:
+                    seen.add(b.next)
+                    queue.append(b.next)
+        return seen
+
+
+def fill(text: str, answer: Optional[str]) -> str:
+    """把患者回答填进剧本文本。消息内容按 HTML 渲染（剧本里的标记原样保留），
+    患者的自由输入先转义，"<img onerror=...>" 这样的名字只会显示成文字。"""
+    return text.replace(ANSWER, html.escape(answer)) if answer is not None and ANSWER in text else text
+
+
+def record_answer(profile: dict, node: Node, answer: str) -> None:
+    """把回答写入 profile：按钮选项去掉方括号和空白；列表字段（如 topics）保持列表类型；
+    带 normalize 的文本阶段写入规范化后的字段。"""
+    if node.normalize is not None:
+        profile.update(node.normalize(answer))
+        return
+    value = answer.strip("[] ") if node.input == BUTTONS else answer
+    if isinstance(profile.get(node.profile_key), list):
+        profile[node.profile_key] = [value]
+    else:
+        profile[node.profile_key] = value
+
+
+def respond(graph: DialogueGraph, node: Node, answer: Optional[str], profile: dict) -> Tuple[str, List[Say]]:
+    """处理一次回答：写入 profile（谓词分支可以读到刚写入的值），返回 (下一阶段, 要追加的消息)。不依赖 Streamlit。"""
+    said: List[Say] = []
+    if answer is not None:
+        if node.profile_key or node.normalize:
+            record_answer(profile, node, answer)
+        echo = answer if node.input == BUTTONS else fill(node.echo, answer)
+        said.append(Say("patient", echo))
+    branch = graph.route(node, answer, profile)
+    said.extend(s._replace(text=fill(s.text, answer)) for s in branch.say)
+    return branch.next, said
@@ -0,0 +1,154 @@
+"""与界面无关的问诊状态机。
+
+会话状态是一个普通映射，字段为 stage / profile / messages / said（与会话存储
+session_store.FIELDS 一致）；Streamlit 前端直接传入 st.session_state，HTTP API
+（ehealth/api.py）传入从会话存储取出的字典。引擎只做“输入事件 → 追加消息 + 下一
+阶段”，不碰任何控件，也不触发 rerun。
+
+    state = new_state()
+    ENGINE.start(state)                 # 说出起始阶段的提示语
+    ENGINE.answer(state, "[Hi]")        # 返回本次新增的消息
+    ENGINE.controls(state)              # 当前阶段的输入方式、选项、占位提示
+
+on_event 收到每一次回答 (ANSWER, 阶段, 回答) 和每一次阶段切换 (ENTER, 阶段)，
+调用方据此写事件流（见 ehealth/events.py）。
+"""
+from typing import Callable, Dict, List, MutableMapping, NamedTuple, Optional, Tuple
+
+from ehealth.dialogue import AUTO, BUTTONS, END, TEXT, DialogueGraph, respond
+from ehealth.messages import Message
+from ehealth.script import GRAPH
+
+
+# on_event 的事件类型
+ANSWER = "answer"
+ENTER = "enter"
+
+
+class InvalidAnswer(ValueError):
+    """回答与当前阶段不符（不是当前选项、空文本、或当前阶段不接受输入）。"""
+
+
+class Controls(NamedTuple):
+    input: str
+    options: Tuple[str, ...] = ()
+    placeholder: Optional[str] = None
+
+
+def new_profile() -> Dict:
+    """问诊收集的全部字段；每个阶段的回答写入对应字段（见 ehealth/script.py 的 profile_key）。"""
+    return {
+        "preferred_name": None,
+        "feeling": None,
+        "first_time_online": None,
+        "topics": [],
+        "ongoing_issues": None,
+        "issues_detail": None,
+        "occupation": None,
+        "employment_status": None,
+        "work_stress": None,
+        "relax": None,
+        "smoke_now": None,
+        "smoke_6m": None,
+        "drink": None,
+        "drink_freq": None,
+        "exercise_freq": None,
+        "exercise_types": None,
+        "companionship": None,
+        "fruit_freq": None,
+        "veg_freq": None,
+        "grain_freq": None,
+        "protein_freq": None,
+        "dairy_freq": None,
+        "cook_at_home": None,
+        "try_new_recipes": None,
+        "sleep_quality_1_5": None,
+        "screen_before_bed": None,
+        "diff_fall_asleep": None,
+        "night_wake_diff": None,
+        "morning_tired": None,
+        "family_sleep_history": None,
+    }
+
+
+def new_state(graph: DialogueGraph = GRAPH) -> Dict:
+    return {"stage": graph.start, "profile": new_profile(), "messages": [], "said": set()}
+
+
+class Engine:
+    def __init__(self, graph: DialogueGraph = GRAPH, on_finish: Optional[Callable[[MutableMapping], None]] = None,
+                 on_event: Optional[Callable[[MutableMapping, Tuple], None]] = None):
+        self.graph = graph
+        self.on_finish = on_finish  # 会话到达 END 阶段时回调
+        self.on_event = on_event  # 回答和阶段切换时回调
+
+    def _event(self, state: MutableMapping, *event) -> None:
+        if self.on_event is not None:
+            self.on_event(state, event)
+
+    def _emit(self, state: MutableMapping, lines, prompt_id: Optional[str] = None) -> None:
+        messages = state["messages"]
+        for line in lines:
+            messages.append(Message(line.role, line.text, line.delay, line.image))
+        if prompt_id:
+            state["said"].add(prompt_id)
+
+    def prompt(self, state: MutableMapping) -> None:
+        """进入阶段时的提示语每个会话只说一次：按阶段 ID 查 said 集合。"""
+        node = self.graph[state["stage"]]
+        if (node.prompt or node.compose) and node.id not in state["said"]:
+            lines = node.prompt
+            if node.compose is not None:
+                lines += node.compose(state["profile"])
+            self._emit(state, lines, prompt_id=node.id)
+
+    def advance(self, state: MutableMapping, next_stage: str) -> None:
+        """进入下一阶段，并连续走完所有无需输入的阶段（AUTO）。"""
+        while True:
+            state["stage"] = next_stage
+            self._event(state, ENTER, next_stage)
+            node = self.graph[next_stage]
+            self.prompt(state)
+            if node.input == END and self.on_finish is not None:
+                self.on_finish(state)
+            if node.input != AUTO:
+                return
+            next_stage, lines = respond(self.graph, node, None, state["profile"])
+            self._emit(state, lines)
+
+    def start(self, state: MutableMapping) -> None:
+        """说出当前阶段的提示语；停在 AUTO 阶段（例如脚本起点）时就地推进。"""
+        if self.graph[state["stage"]].input == AUTO:
+            self.advance(state, state["stage"])
+        else:
+            self.prompt(state)
+
+    def answer(self, state: MutableMapping, value: str) -> List[Message]:
+        """处理一次回答，返回本次新增的消息。"""
+        node = self.graph[state["stage"]]
+        if node.input == BUTTONS:
+            if value not in node.options:
+                raise InvalidAnswer(f"{value!r} is not an option of stage {node.id!r}")
+        elif node.input == TEXT:
+            if not value or not value.strip():
+                raise InvalidAnswer(f"stage {node.id!r} needs a non-empty answer")
+        else:
+            raise InvalidAnswer(f"stage {node.id!r} does not take input")
+        self._event(state, ANSWER, node.id, value)
+        messages = state["messages"]
+        before = len(messages)
+        next_stage, lines = respond(self.graph, node, value, state["profile"])
+        self._emit(state, lines)
+        self.advance(state, next_stage)
+        return messages[before:]
+
+    def controls(self, state: MutableMapping) -> Controls:
+        node = self.graph[state["stage"]]
+        if node.input == BUTTONS:
+            return Controls(BUTTONS, node.options)
+        if node.input == TEXT:
+            return Controls(TEXT, placeholder=node.placeholder)
+        return Controls(node.input)
+
+    def finished(self, state: MutableMapping) -> bool:
+        return self.graph[state["stage"]].input == END
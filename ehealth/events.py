@@ -0,0 +1,127 @@
+"""问诊事件流（只追加），用于复盘和重放。
+
+会话状态里只有渲染出的消息，看不出患者为什么走了某个分支，也无法重现一次慢会话。
+这里按会话记录每一次输入和阶段切换，每行一个紧凑的 JSON 数组：
+
+    ["<sid>",1760000000.123,"new","<剧本文本版本>"]    新会话（或在首页重新开始）
+    ["<sid>",1760000004.560,"answer","doctor_job","nurse"]
+    ["<sid>",1760000004.561,"enter","doctor_stress"]   引擎进入的每个阶段（含 AUTO 阶段）
+    ["<sid>",1760000009.000,"home"]                    回到首页
+
+一次脚本运行（或一次 API 请求）产生的事件先暂存，会话状态成功写回后才交给后台线程
+按批追加到 EHEALTH_EVENTS_PATH（默认 data/events.jsonl，超过 64 MB 或满一天轮转）；因并发
+冲突被丢弃的改动不会留下事件。EHEALTH_EVENTS=off 关闭。
+
+事件里有原样的自由文本回答（姓名、健康问题），不长期保留：轮转出的文件超过
+EHEALTH_EVENTS_MAX_AGE_DAYS（默认 30 天）即删除，0 表示不删除。
+
+重放见 ehealth/replay.py。
+"""
+import atexit
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ehealth.consultations import DATA_DIR, JsonlSink, WriteBehindQueue
+from ehealth.engine import ANSWER, ENTER  # 引擎产生的事件类型，重放时一并使用
+from ehealth.metrics import REGISTRY
+
+
+EVENTS_KIND = os.environ.get("EHEALTH_EVENTS", "jsonl")
+EVENTS_PATH = os.environ.get("EHEALTH_EVENTS_PATH", "")
+MAX_AGE = float(os.environ.get("EHEALTH_EVENTS_MAX_AGE_DAYS", "30")) * 86400
+ROTATE_SECONDS = 86400  # 当前文件最多写一天，保证过期的事件都在可以整文件删除的轮转文件里
+if EVENTS_KIND not in ("jsonl", "off"):
+    raise ValueError(f"unknown EHEALTH_EVENTS {EVENTS_KIND!r}")
+
+# 应用层事件（回答和阶段切换由引擎产生）
+NEW = "new"
+HOME = "home"
+
+
+def stamp(event: Tuple) -> List:
+    """引擎/应用产生的 (类型, 参数...) -> [时间, 类型, 参数...]"""
+    return [round(time.time(), 3), *event]
+
+
+class EventSink(JsonlSink):
+    def __init__(self, path: Path, max_age: float = MAX_AGE):
+        super().__init__(path)
+        self.max_age = max_age
+        self.started = self._first_event_time()
+        self.purge()
+
+    def _first_event_time(self) -> Optional[float]:
+        with open(self.path, encoding="utf-8") as f:
+            line = f.readline()
+        try:
+            return float(json.loads(line)[1])
+        except (ValueError, IndexError, TypeError):
+            return None  # 空文件（或首行写了一半）：从下一次写入算起
+
+    def write(self, rows: List[Dict]) -> None:
+        if self.started is not None and time.time() - self.started >= ROTATE_SECONDS:
+            self.rotate()
+        if self.started is None:
+            self.started = time.time()
+        super().write(rows)
+
+    def rotate(self) -> None:
+        super().rotate()
+        self.started = None
+        self.purge()
+
+    def purge(self) -> int:
+        """删除超过保留期的轮转文件（修改时间即其中最后一条事件的时间），返回删除的个数。"""
+        if not self.max_age:
+            return 0
+        deadline = time.time() - self.max_age
+        removed = 0
+        for segment in self.path.parent.glob(f"{self.path.stem}-*{self.path.suffix}"):
+            try:
+                if segment.stat().st_mtime < deadline:
+                    segment.unlink()
+                    removed += 1
+            except OSError:
+                continue
+        return removed
+
+    def format(self, rows: List[Dict]) -> str:
+        return "".join(
+            json.dumps([row["sid"], *event], ensure_ascii=False, separators=(",", ":")) + "\n"
+            for row in rows for event in row["events"]
+        )
+
+
+def open_sink(path: str = EVENTS_PATH) -> EventSink:
+    return EventSink(Path(path) if path else DATA_DIR / "events.jsonl")
+
+
+store = WriteBehindQueue(open_sink, prepare=lambda record: record, name="events")
+atexit.register(store.flush)
+REGISTRY.add_collector(lambda: {f"events_{k}": v for k, v in store.stats().items()})
+
+
+def submit(sid: str, events: List[List]) -> None:
+    """提交一次运行中已写回的事件（已按 stamp 加上时间）；只入队，不等待写盘。"""
+    if EVENTS_KIND == "off" or not events:
+        return
+    store.submit({"sid": sid, "events": list(events)})
+
+
+def read(paths: Iterable[Path]) -> Iterator[List]:
+    """按文件顺序读出事件 [sid, 时间, 类型, 参数...]；跳过进程崩溃时写了一半的行。"""
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"{path}:{number}: skipping malformed event", file=sys.stderr)
+                    continue
+                yield event
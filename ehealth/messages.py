@@ -0,0 +1,128 @@
+"""紧凑的聊天消息记录。
+
+每条消息是一个 __slots__ 对象，只保存 (角色 ID, 文本 ID, 参数, 延迟, 图片 ID)。
+剧本中出现的文本（提示语、回复、选项、图片说明与路径）在 import 时按剧本顺序收进
+进程级共享的 SCRIPT_TEXTS 表并做 sys.intern，消息只引用其下标；患者自由输入等
+剧本外的文本使用 RAW 模板，原文放在 param 中。同一份代码构建出的文本表在各进程中
+下标一致，消息可以直接按元组序列化。
+"""
+import hashlib
+import sys
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ehealth.dialogue import ANSWER
+from ehealth.script import GRAPH
+
+
+ROLES = ("receptionist", "doctor", "patient")
+ROLE_IDS = {role: i for i, role in enumerate(ROLES)}
+
+RAW = 0  # 模板 "{answer}"：剧本外的文本原样放在 param 中
+NO_IMAGE = -1
+
+
+class TextTable:
+    """剧本文本表：文本 <-> 下标，双向 O(1)。"""
+
+    def __init__(self, texts: Iterable[str] = ()):
+        self.texts: List[str] = []
+        self.ids: Dict[str, int] = {}
+        self.add(ANSWER)
+        for text in texts:
+            self.add(text)
+        self.version = hashlib.sha256("\0".join(self.texts).encode("utf-8")).hexdigest()[:12]
+
+    def add(self, text: str) -> int:
+        text_id = self.ids.get(text)
+        if text_id is None:
+            text = sys.intern(text)
+            text_id = len(self.texts)
+            self.texts.append(text)
+            self.ids[text] = text_id
+        return text_id
+
+    def lookup(self, text: str) -> Optional[int]:
+        return self.ids.get(text)
+
+    def __getitem__(self, text_id: int) -> str:
+        return self.texts[text_id]
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+
+def script_texts(graph) -> Iterable[str]:
+    """按剧本顺序列出所有固定文本，保证文本表下标稳定。"""
+    for node in graph.nodes.values():
+        for line in node.prompt:
+            yield line.text
+            if line.image:
+                yield line.image
+        yield from node.options
+        for branch in node.branches:
+            for line in branch.say:
+                yield line.text
+
+
+SCRIPT_TEXTS = TextTable(script_texts(GRAPH))
+
+
+class Message:
+    __slots__ = ("role_id", "template_id", "param", "delay", "image_id")
+
+    def __init__(self, role: str, text: str, delay: float = 0, image_path: Optional[str] = None):
+        self.role_id = ROLE_IDS[role]
+        template_id = SCRIPT_TEXTS.lookup(text)
+        if template_id is None:
+            self.template_id, self.param = RAW, text
+        else:
+            self.template_id, self.param = template_id, None
+        self.delay = delay
+        if image_path is None:
+            self.image_id = NO_IMAGE
+        else:
+            image_id = SCRIPT_TEXTS.lookup(image_path)
+            if image_id is None:
+                # 剧本外的图片路径很少见，按需加入文本表
+                image_id = SCRIPT_TEXTS.add(image_path)
+            self.image_id = image_id
+
+    @property
+    def role(self) -> str:
+        return ROLES[self.role_id]
+
+    @property
+    def type(self) -> str:
+        return "text" if self.image_id == NO_IMAGE else "image"
+
+    @property
+    def content(self) -> str:
+        template = SCRIPT_TEXTS[self.template_id]
+        return template if self.param is None else template.replace(ANSWER, self.param)
+
+    @property
+    def text(self) -> str:
+        return self.content if self.image_id == NO_IMAGE else ""
+
+    @property
+    def caption(self) -> str:
+        return "" if self.image_id == NO_IMAGE else self.content
+
+    @property
+    def image_path(self) -> Optional[str]:
+        return None if self.image_id == NO_IMAGE else SCRIPT_TEXTS[self.image_id]
+
+    def key(self) -> Tuple:
+        return self.role_id, self.template_id, self.param, self.image_id
+
+    def to_tuple(self) -> Tuple:
+        return self.role_id, self.template_id, self.param, self.delay, self.image_id
+
+    @classmethod
+    def from_tuple(cls, data) -> "Message":
+        m = cls.__new__(cls)
+        m.role_id, m.template_id, m.param, m.delay, m.image_id = data
+        return m
+
+    def __repr__(self) -> str:
+        return f"Message({self.role!r}, {self.content!r}, delay={self.delay!r}, image={self.image_path!r})"
@@ -0,0 +1,323 @@
+"""可选的热路径计时与指标导出。
+
+默认关闭；设置 EHEALTH_METRICS=1 后开启：
+
+- 每次 rerun 的总耗时、各函数（ensure_styles / render_custom_chat / to_data_url /
+  run_stage）耗时、各 stage 处理耗时，以及每次 rerun 下发给浏览器的 HTML 字节数，
+  都记入进程级直方图；
+- EHEALTH_METRICS_PORT=<端口> 时在该端口提供 Prometheus 文本格式的 /metrics；
+- EHEALTH_METRICS_LOG=<路径> 时每次 rerun 追加一行 JSON 记录。
+
+关闭时 phase()/stage_timer() 返回共享的空上下文，开销可以忽略。
+"""
+import json
+import os
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+ENABLED = os.environ.get("EHEALTH_METRICS", "") not in ("", "0")
+METRICS_PORT = int(os.environ.get("EHEALTH_METRICS_PORT", "0") or 0)
+METRICS_LOG = os.environ.get("EHEALTH_METRICS_LOG", "")
+
+PREFIX = "ehealth_"
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+COUNT_BUCKETS = (10, 20, 40, 60, 80, 120, 200)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一格为 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._collectors: List[Callable[[], Dict[str, float]]] = []
+
+    def observe(self, name: str, value: float, buckets=SECONDS_BUCKETS, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram(buckets)
+            hist.observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def add_collector(self, collect: Callable[[], Dict[str, float]]) -> None:
+        """登记一个在导出时调用的函数，返回 {指标名: 当前值}（作为 gauge 导出）。"""
+        with self._lock:
+            self._collectors.append(collect)
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+            collectors = list(self._collectors)
+
+        typed = set()
+        for (name, labels), hist in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {PREFIX}{name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bound, n in zip(hist.buckets + (float("inf"),), hist.counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{PREFIX}{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {hist.sum}")
+            lines.append(f"{PREFIX}{name}_count{_labels(labels)} {hist.count}")
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {PREFIX}{name} counter")
+                typed.add(name)
+            lines.append(f"{PREFIX}{name}{_labels(labels)} {value}")
+        for collect in collectors:
+            for name, value in collect().items():
+                lines.append(f"# TYPE {PREFIX}{name} gauge")
+                lines.append(f"{PREFIX}{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """直方图的 count/sum 快照，便于测试和基准脚本读取。"""
+        with self._lock:
+            return {
+                name + _labels(labels): {"count": h.count, "sum": h.sum}
+                for (name, labels), h in self._histograms.items()
+            }
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+REGISTRY = Registry()
+
+
+# ---------------- 每次 rerun 的记录 -----------------
+class RerunRecord:
+    __slots__ = ("session", "stage", "started", "phases", "payload_bytes", "runs")
+
+    def __init__(self, session: str):
+        self.session = session
+        self.stage: Optional[str] = None
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.payload_bytes = 0
+        self.runs = 0  # 该会话累计的运行次数
+
+
+_current = threading.local()  # 每个会话的脚本在各自线程中运行
+# 每次 rerun 结束时回调 (记录, 总耗时秒)，供基准脚本等进程内消费者使用
+_listeners: List[Callable[[RerunRecord, float], None]] = []
+
+
+def add_listener(listener: Callable[[RerunRecord, float], None]) -> None:
+    _listeners.append(listener)
+
+
+class _Timer:
+    __slots__ = ("name", "labels", "key", "started")
+
+    def __init__(self, name: str, labels: Dict[str, str], key: str):
+        self.name = name
+        self.labels = labels
+        self.key = key  # 在本次 rerun 记录中的分项名
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        REGISTRY.observe(self.name, elapsed, **self.labels)
+        record = getattr(_current, "record", None)
+        if record is not None:
+            record.phases[self.key] = record.phases.get(self.key, 0.0) + elapsed
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL = _NullTimer()
+
+
+def phase(name: str):
+    """按函数计时：with phase("ensure_styles"): ..."""
+    return _Timer("phase_duration_seconds", {"phase": name}, name) if ENABLED else _NULL
+
+
+def stage_timer(stage: str):
+    """按 stage 计时阶段处理器。"""
+    return _Timer("stage_duration_seconds", {"stage": stage}, f"stage:{stage}") if ENABLED else _NULL
+
+
+def record_payload(nbytes: int, mode: str) -> None:
+    if not ENABLED:
+        return
+    REGISTRY.observe("payload_bytes", nbytes, BYTES_BUCKETS, mode=mode)
+    record = getattr(_current, "record", None)
+    if record is not None:
+        record.payload_bytes += nbytes
+
+
+def startup(steps: Dict[str, float]) -> None:
+    if ENABLED:
+        for step, seconds in steps.items():
+            REGISTRY.observe("startup_seconds", seconds, step=step)
+
+
+def session_started() -> None:
+    if ENABLED:
+        REGISTRY.inc("sessions_total")
+
+
+class SessionHandle:
+    """放进 st.session_state 的占位对象，随浏览器会话一起被 Streamlit 回收。"""
+    __slots__ = ("__weakref__",)
+
+
+def track_session(stats: Dict) -> SessionHandle:
+    """句柄被回收（标签页关闭、会话过期）时，没走完问诊的会话也记一次 session_reruns。"""
+    handle = SessionHandle()
+    if ENABLED:
+        weakref.finalize(handle, _session_closed, stats).atexit = False
+    return handle
+
+
+def _session_closed(stats: Dict) -> None:
+    if not stats.get("finished"):
+        REGISTRY.observe("session_reruns", stats["runs"], COUNT_BUCKETS, outcome="abandoned")
+
+
+def session_finished(stats: Dict) -> None:
+    stats["finished"] = True
+    if ENABLED:
+        REGISTRY.observe("session_reruns", stats["runs"], COUNT_BUCKETS, outcome="finished")
+
+
+def session_restored() -> None:
+    if ENABLED:
+        REGISTRY.inc("sessions_restored_total")
+
+
+def session_conflict() -> None:
+    if ENABLED:
+        REGISTRY.inc("session_conflicts_total")
+
+
+@contextmanager
+def rerun(session: str, runs: int = 0, stage: Optional[str] = None):
+    """包住一次完整的脚本运行；st.rerun() 抛出的控制异常也会被计入。"""
+    if not ENABLED:
+        yield None
+        return
+    record = RerunRecord(session)
+    record.runs = runs
+    record.stage = stage
+    _current.record = record
+    try:
+        yield record
+    finally:
+        _current.record = None
+        elapsed = time.perf_counter() - record.started
+        REGISTRY.observe("rerun_duration_seconds", elapsed)
+        REGISTRY.inc("reruns_total")
+        _log(record, elapsed)
+        for listener in _listeners:
+            listener(record, elapsed)
+
+
+# ---------------- 导出 -----------------
+_log_lock = threading.Lock()
+_log_file = None
+
+
+def _log(record: RerunRecord, elapsed: float) -> None:
+    global _log_file
+    if not METRICS_LOG:
+        return
+    line = json.dumps({
+        "ts": round(time.time(), 3),
+        "session": record.session,
+        "stage": record.stage,
+        "run": record.runs,
+        "total_ms": round(elapsed * 1000, 3),
+        "phases_ms": {k: round(v * 1000, 3) for k, v in record.phases.items()},
+        "payload_bytes": record.payload_bytes,
+    }, ensure_ascii=False)
+    with _log_lock:
+        if _log_file is None:
+            _log_file = open(METRICS_LOG, "a", encoding="utf-8", buffering=1)
+        _log_file.write(line + "\n")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_server_lock = threading.Lock()
+_server_started = False
+
+
+def start() -> None:
+    """开启时启动 /metrics 端点（每个进程只尝试一次）；端口被占用时静默跳过。"""
+    global _server_started
+    if not ENABLED or not METRICS_PORT:
+        return
+    with _server_lock:
+        if _server_started:
+            return
+        _server_started = True
+        try:
+            server = ThreadingHTTPServer(("127.0.0.1", METRICS_PORT), _MetricsHandler)
+        except OSError:
+            return
+        threading.Thread(target=server.serve_forever, name="ehealth-metrics", daemon=True).start()
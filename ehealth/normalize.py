@@ -0,0 +1,245 @@
+"""自由文本回答的规范化。
+
+职业、工作压力（0-10）和睡眠质量（1-5）三个文本阶段的回答在写入 profile 前转换为
+带类型的值：
+
+- 职业：所有同义词在 import 时按公共前缀编译成一个正则，一次扫描判断就业状态，
+  原文仍写入 occupation，另写 employment_status；"don't work weekends, nurse" 这类
+  只否定工作时间的说法，同时提到职业时仍算在职；
+- 打分：取回答中的第一个阿拉伯数字（"6-7"、"8/10" 等写法），没有时才认 "seven" 等
+  英文单词；复述量表范围（"0-10, I would say 8"）的区间跳过；超出量表范围时记为 None。
+
+同一套函数可以批量处理历史问诊记录：
+
+    python -m ehealth.normalize data/consultations.db [--write]
+    python -m ehealth.normalize data/consultations.jsonl > normalized.jsonl
+"""
+import argparse
+import json
+import re
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+
+# ---------------- 就业状态 -----------------
+EMPLOYED = "employed"
+UNEMPLOYED = "unemployed"
+STUDENT = "student"
+RETIRED = "retired"
+HOMEMAKER = "homemaker"
+UNABLE = "unable_to_work"
+EMPLOYMENT_STATUSES = (EMPLOYED, UNEMPLOYED, STUDENT, RETIRED, HOMEMAKER, UNABLE)
+
+# 命中任意一个即视为没有在职工作（跳过工作压力问题）；词尾可带复数 s/es
+EMPLOYMENT_SYNONYMS = {
+    UNEMPLOYED: (
+        "unemployed", "not employed", "jobless", "out of work", "out of a job", "between jobs",
+        "no job", "without a job", "not working", "don't work", "dont work", "do not work",
+        "laid off", "lost my job", "got fired", "been fired", "looking for work", "looking for a job",
+        "job hunting", "job seeker", "job seeking", "on benefits", "nothing at the moment", "nothing right now",
+    ),
+    STUDENT: (
+        "student", "studying", "undergrad", "postgrad", "grad school",
+    ),
+    RETIRED: ("retired", "retiree", "pensioner", "on a pension", "on pension"),
+    HOMEMAKER: (
+        "homemaker", "stay at home", "stay-at-home", "stay home", "housewife", "househusband",
+        "home maker", "full-time parent", "full time parent", "full-time mom", "full time mom",
+        "full-time dad", "full time dad",
+    ),
+    UNABLE: ("on disability", "unable to work", "can't work", "cannot work", "on sick leave"),
+}
+
+_STATUS_BY_PHRASE = {
+    phrase: status for status, phrases in EMPLOYMENT_SYNONYMS.items() for phrase in phrases
+}
+# 只说某些时候不工作的短语：同一回答里提到职业时仍视为在职
+WORK_NEGATIONS = ("not working", "don't work", "dont work", "do not work", "can't work", "cannot work")
+# 常见职业名称（词首匹配，复数也算）
+OCCUPATIONS = (
+    "accountant", "analyst", "architect", "assistant", "baker", "barista", "builder", "carer", "cashier",
+    "chef", "cleaner", "clerk", "consultant", "cook", "coordinator", "designer", "developer", "doctor",
+    "driver", "electrician", "engineer", "farmer", "freelance", "lawyer", "lecturer", "manager",
+    "mechanic", "nurse", "officer", "pharmacist", "plumber", "professor", "programmer", "receptionist",
+    "researcher", "salesman", "saleswoman", "scientist", "secretary", "self-employed", "self employed",
+    "shop assistant", "social worker", "surgeon", "teacher", "teach", "teaching", "technician",
+    "therapist", "waiter", "waitress", "writer",
+)
+
+
+def _trie_pattern(words) -> str:
+    """把一组短语编译成按公共前缀嵌套的正则（Aho-Corasick 的正则版）：每个位置只沿一条
+    前缀路径匹配，不必逐个尝试全部短语。"""
+    trie: Dict = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}  # 词尾标记
+
+    def build(node: Dict) -> str:
+        ends = "" in node
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return "(?:" + body + ")?" if ends else body
+
+    return build(trie)
+
+
+# 单个正则一次扫描；同一位置上较长的短语优先（嵌套结构天然贪婪）
+_EMPLOYMENT_RE = re.compile(r"\b(" + _trie_pattern(_STATUS_BY_PHRASE) + r")(?:e?s)?\b", re.IGNORECASE)
+_OCCUPATION_RE = re.compile(r"\b(?:" + _trie_pattern(OCCUPATIONS) + r")(?:e?s)?\b", re.IGNORECASE)
+_APOSTROPHES = str.maketrans("’‘`", "'''")
+
+
+def employment_status(text: str) -> str:
+    text = text.translate(_APOSTROPHES)
+    match = _EMPLOYMENT_RE.search(text)
+    if match is None:
+        return EMPLOYED
+    phrase = match.group(1).lower()
+    if phrase in WORK_NEGATIONS and _OCCUPATION_RE.search(text):
+        return EMPLOYED
+    return _STATUS_BY_PHRASE[phrase]
+
+
+# ---------------- 量表打分 -----------------
+_NUMBER_WORDS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+}
+
+
+def _score_re(number: str) -> "re.Pattern":
+    # 一个数字，可带 "-"/"to"/"or" 连接的区间
+    return re.compile(
+        r"(?<![\w.])(" + number + r")\b(?:\s*(?:-|–|to|or)\s*(" + number + r")\b)?", re.IGNORECASE
+    )
+
+
+# 阿拉伯数字优先；英文单词只在没有数字时使用（"no one" 不算 1）
+_SCORE_RES = (
+    _score_re(r"\d+(?:\.\d+)?"),
+    _score_re(r"(?<!no )(?:" + "|".join(_NUMBER_WORDS) + ")"),
+)
+
+
+def _number(token: str) -> float:
+    word = _NUMBER_WORDS.get(token.lower())
+    return float(word) if word is not None else float(token)
+
+
+def score(text: str, low: int, high: int) -> Optional[int]:
+    """提取量表分数；区间取中点并四舍五入；没有数字或超出 [low, high] 时返回 None。"""
+    for pattern in _SCORE_RES:
+        for match in pattern.finditer(text):
+            value = _number(match.group(1))
+            if match.group(2):
+                second = _number(match.group(2))
+                if (value, second) == (low, high):
+                    continue  # 复述的量表范围，不是回答
+                value = (value + second) / 2
+            value = int(value + 0.5)
+            return value if low <= value <= high else None
+    return None
+
+
+# ---------------- 各阶段的规范化函数（见 ehealth/script.py 的 normalize） -----------------
+# 打分字段的量表范围
+SCORES = {"work_stress": (0, 10), "sleep_quality_1_5": (1, 5)}
+
+
+def occupation(answer: str) -> Dict:
+    return {"occupation": answer.strip(), "employment_status": employment_status(answer)}
+
+
+def work_stress(answer: str) -> Dict:
+    return {"work_stress": score(answer, *SCORES["work_stress"])}
+
+
+def sleep_quality(answer: str) -> Dict:
+    return {"sleep_quality_1_5": score(answer, *SCORES["sleep_quality_1_5"])}
+
+
+# profile 中原文字段 -> 规范化函数；批量处理历史记录时按此重算
+NORMALIZERS = {
+    "occupation": occupation,
+    "work_stress": work_stress,
+    "sleep_quality_1_5": sleep_quality,
+}
+
+
+def normalize_profile(profile: Dict) -> Dict:
+    """重算一份 profile 中的带类型字段；已是数字（已规范化过）的字段保持不变。"""
+    out = dict(profile)
+    for key, normalize in NORMALIZERS.items():
+        value = profile.get(key)
+        if isinstance(value, str):
+            out.update(normalize(value))
+    return out
+
+
+# ---------------- 批量处理 -----------------
+def iter_records(path: Path) -> Iterator[Dict]:
+    if path.suffix == ".jsonl":
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+    conn = sqlite3.connect(str(path))
+    try:
+        for id_, profile in conn.execute("SELECT id, profile FROM consultations"):
+            yield {"id": id_, "profile": json.loads(profile)}
+    finally:
+        conn.close()
+
+
+def _write_sqlite(path: Path, records: List[Dict]) -> None:
+    conn = sqlite3.connect(str(path))
+    try:
+        with conn:
+            conn.executemany(
+                "UPDATE consultations SET profile = ? WHERE id = ?",
+                [(json.dumps(r["profile"], ensure_ascii=False), r["id"]) for r in records],
+            )
+    finally:
+        conn.close()
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m ehealth.normalize", description=__doc__.split("\n")[0])
+    parser.add_argument("paths", nargs="+", type=Path, help="consultations .db or .jsonl files")
+    parser.add_argument("--write", action="store_true", help="update profiles in SQLite files in place")
+    args = parser.parse_args(argv)
+
+    total = 0
+    counts: Dict[str, int] = {}
+    started = time.perf_counter()
+    for path in args.paths:
+        records = []
+        for record in iter_records(path):
+            record["profile"] = normalize_profile(record["profile"])
+            status = record["profile"].get("employment_status") or "-"
+            counts[status] = counts.get(status, 0) + 1
+            records.append(record)
+        total += len(records)
+        if path.suffix == ".jsonl" or not args.write:
+            for record in records:
+                sys.stdout.write(json.dumps(record, ensure_ascii=False) + "\n")
+        else:
+            _write_sqlite(path, records)
+    elapsed = time.perf_counter() - started
+    rate = total / elapsed if elapsed else 0.0
+    summary = " ".join(f"{k}={v}" for k, v in sorted(counts.items()))
+    print(f"normalized {total} consultations in {elapsed:.3f}s ({rate:.0f}/s) {summary}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
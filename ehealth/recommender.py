@@ -0,0 +1,229 @@
+"""可替换的建议推荐后端。
+
+医生在最终建议里说会参考 “AI system's recommendation”；这里把推荐做成可替换的后端，
+由 EHEALTH_RECOMMENDER 选择：
+
+- local（默认）：离线、确定性，用 ehealth/advice.py 的规则表；
+- http：把特征以 JSON POST 到 EHEALTH_RECOMMENDER_URL，期望返回 {"tips": [...]}；
+- off：不给个性化建议；
+- 任意 "包.模块:工厂函数"：工厂返回一个 Recommender 实例。
+
+后端只拿到规范化后的特征（按钮选项、就业状态、压力/睡眠分数；不含姓名等自由文本），
+在有界线程池里调用，脚本线程最多等待超时时间，排队的调用数也有上限：
+
+- 每次调用最多等 EHEALTH_RECOMMENDER_TIMEOUT 秒（默认 2），超时、出错或排队已满时
+  退回静态建议（只说 FINAL_ADVICE，不追加个性化消息）；超时的调用仍在后台完成并写入缓存；
+- 结果按特征缓存（LRU，EHEALTH_RECOMMENDER_CACHE 条，默认 4096），相同回答组合
+  不会重复调用后端；同一组合正在调用时后来者等待同一次调用。
+"""
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from concurrent import futures
+from functools import partial
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+from ehealth import advice, metrics
+from ehealth.dialogue import Say
+from ehealth.metrics import REGISTRY
+from ehealth.normalize import normalize_profile
+
+
+BACKEND = os.environ.get("EHEALTH_RECOMMENDER", "local")
+URL = os.environ.get("EHEALTH_RECOMMENDER_URL", "")
+TIMEOUT = float(os.environ.get("EHEALTH_RECOMMENDER_TIMEOUT", "2"))
+WORKERS = int(os.environ.get("EHEALTH_RECOMMENDER_WORKERS", "4"))
+CACHE_SIZE = int(os.environ.get("EHEALTH_RECOMMENDER_CACHE", "4096"))
+MAX_PENDING = WORKERS * 8  # 超出时不再排队，直接退回静态建议
+
+# 自由文本字段不进入特征：既不外传，也不会让每个患者的缓存键都不同（规范化后的
+# employment_status / work_stress / sleep_quality_1_5 代替原文）
+FREE_TEXT = ("preferred_name", "issues_detail", "occupation", "relax", "exercise_types")
+
+
+class RecommenderError(RuntimeError):
+    """后端配置无效或返回了无法识别的结果。"""
+
+
+def features(profile: Dict) -> Dict:
+    """profile -> 特征字典（键有序、值可哈希），也是缓存键的来源。"""
+    out = {}
+    for key, value in sorted(normalize_profile(profile).items()):
+        if key in FREE_TEXT:
+            continue
+        out[key] = tuple(value) if isinstance(value, list) else value
+    return out
+
+
+class Recommender:
+    """后端接口：按特征返回建议文本（按优先级）。在线程池里调用，可以阻塞。"""
+
+    name = "base"
+
+    def recommend(self, features: Dict) -> List[str]:
+        raise NotImplementedError
+
+
+class LocalRecommender(Recommender):
+    name = "local"
+
+    def recommend(self, features: Dict) -> List[str]:
+        return [rule.text for rule in advice.engine().tips(features)]
+
+
+class HttpRecommender(Recommender):
+    name = "http"
+
+    def __init__(self, url: str, timeout: float = TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+
+    def recommend(self, features: Dict) -> List[str]:
+        request = urllib.request.Request(
+            self.url,
+            json.dumps({"features": features}).encode("utf-8"),
+            {"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            tips = json.load(response).get("tips")
+        if not isinstance(tips, list) or not all(isinstance(tip, str) for tip in tips):
+            raise RecommenderError(f"{self.url} returned no list of tips")
+        return tips
+
+
+def create_backend(kind: str = BACKEND, url: str = URL) -> Optional[Recommender]:
+    if kind == "off":
+        return None
+    if kind == "local":
+        return LocalRecommender()
+    if kind == "http":
+        if not url:
+            raise RecommenderError("EHEALTH_RECOMMENDER=http needs EHEALTH_RECOMMENDER_URL")
+        return HttpRecommender(url)
+    module, sep, attr = kind.partition(":")
+    if not sep:
+        raise RecommenderError(f"unknown EHEALTH_RECOMMENDER {kind!r}")
+    try:
+        backend = getattr(importlib.import_module(module), attr)()
+    except (ImportError, AttributeError) as exc:
+        raise RecommenderError(f"cannot load recommender {kind!r}: {exc}") from None
+    if not isinstance(backend, Recommender):
+        raise RecommenderError(f"{kind!r} did not return a Recommender")
+    return backend
+
+
+class RecommendationService:
+    """进程级：后端、线程池、结果缓存和正在进行的调用。"""
+
+    def __init__(self, backend_factory: Callable[[], Optional[Recommender]], workers: int = WORKERS,
+                 timeout: float = TIMEOUT, cache_size: int = CACHE_SIZE, max_pending: int = MAX_PENDING):
+        self._backend_factory = backend_factory
+        self.workers = workers
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._backend: Optional[Recommender] = None
+        self._loaded = False
+        self._pool: Optional[futures.ThreadPoolExecutor] = None
+        self._cache: "OrderedDict[Hashable, Tuple[str, ...]]" = OrderedDict()
+        self._inflight: Dict[Hashable, futures.Future] = {}
+        self.hits = 0
+        self.calls = 0
+        self.shared = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.rejected = 0
+
+    def backend(self) -> Optional[Recommender]:
+        """第一次使用时创建后端（通常在启动预热时）；配置无效抛出 RecommenderError。"""
+        with self._lock:
+            if not self._loaded:
+                self._backend = self._backend_factory()
+                self._loaded = True
+            return self._backend
+
+    def _call(self, backend: Recommender, feats: Dict) -> Tuple[str, ...]:
+        started = time.perf_counter()
+        tips = tuple(backend.recommend(feats))[:advice.MAX_TIPS]
+        if metrics.ENABLED:
+            REGISTRY.observe("recommender_seconds", time.perf_counter() - started, backend=backend.name)
+        return tips
+
+    def _done(self, key: Hashable, future: futures.Future) -> None:
+        with self._lock:
+            self._inflight.pop(key, None)
+            if future.exception() is not None:
+                return
+            self._cache[key] = future.result()
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def recommend(self, profile: Dict) -> Tuple[str, ...]:
+        """返回建议文本；退回静态建议时返回空元组。"""
+        backend = self.backend()
+        if backend is None:
+            return ()
+        feats = features(profile)
+        key = tuple(feats.items())
+        with self._lock:
+            tips = self._cache.get(key)
+            if tips is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return tips
+            future = self._inflight.get(key)
+            if future is not None:
+                self.shared += 1
+                submitted = False
+            elif len(self._inflight) >= self.max_pending:
+                self.rejected += 1
+                return ()
+            else:
+                if self._pool is None:
+                    self._pool = futures.ThreadPoolExecutor(self.workers, thread_name_prefix="ehealth-recommender")
+                future = self._inflight[key] = self._pool.submit(self._call, backend, feats)
+                self.calls += 1
+                submitted = True
+        if submitted:
+            # 在锁外登记：已完成的 future 会立即在本线程回调
+            future.add_done_callback(partial(self._done, key))
+        try:
+            return future.result(timeout=self.timeout)
+        except futures.TimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            print(f"ehealth: recommender {backend.name} timed out after {self.timeout}s", file=sys.stderr)
+        except Exception as exc:
+            with self._lock:
+                self.errors += 1
+            print(f"ehealth: recommender {backend.name} failed: {exc}", file=sys.stderr)
+        return ()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "cache_entries": len(self._cache),
+                "cache_hits_total": self.hits,
+                "calls_total": self.calls,
+                "shared_total": self.shared,
+                "timeouts_total": self.timeouts,
+                "errors_total": self.errors,
+                "rejected_total": self.rejected,
+                "inflight": len(self._inflight),
+            }
+
+
+SERVICE = RecommendationService(create_backend)
+REGISTRY.add_collector(lambda: {f"recommender_{k}": v for k, v in SERVICE.stats().items()})
+
+
+def personal_advice(profile: Dict) -> Tuple[Say, ...]:
+    """剧本中建议阶段的 compose 钩子。"""
+    return advice.tips_message(SERVICE.recommend(profile))
@@ -0,0 +1,165 @@
+"""从事件流无界面地重放问诊。
+
+事件流（ehealth/events.py）记录了每个会话的全部输入；这里按顺序把它们交给同一个对话
+引擎，不渲染页面、不等待消息延迟，用来：
+
+- 重现会话的完整对话记录（--transcript，可用 --session 只看一个会话）；
+- 检查剧本改动：重放时进入的阶段与记录不一致、或记录的回答在当前剧本里已无效时，
+  报告该会话第一次出现分歧的位置（之后的事件不再重放）；
+- 用真实流量衡量引擎：统计每次回答的处理耗时；
+- 重建派生存储：把走完的会话写入问诊库（--consultations，.db 为 SQLite，否则 JSONL），
+  记录 id 即会话 sid，重复重建不会产生重复记录。
+
+    python -m ehealth.replay data/events*.jsonl [--session SID] [--transcript] [--consultations rebuilt.db]
+
+最终建议中的个性化部分取决于当前配置的推荐后端（见 ehealth/recommender.py）。
+"""
+import argparse
+import sys
+import time
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Tuple
+
+from ehealth import consultations
+from ehealth.dialogue import DialogueGraph
+from ehealth.engine import Engine, InvalidAnswer, new_state
+from ehealth.events import ANSWER, ENTER, HOME, NEW, read
+from ehealth.messages import SCRIPT_TEXTS
+from ehealth.script import GRAPH
+
+
+class Session:
+    __slots__ = ("sid", "state", "entered", "version", "finished_at", "divergence")
+
+    def __init__(self, sid: str):
+        self.sid = sid
+        self.state: Optional[Dict] = None  # None：还没开始或在首页
+        self.entered: Deque[str] = deque()  # 重放时进入、尚未与记录核对的阶段
+        self.version: Optional[str] = None
+        self.finished_at: Optional[float] = None
+        self.divergence: Optional[Tuple[float, str]] = None
+
+
+class Replayer:
+    def __init__(self, graph: DialogueGraph = GRAPH):
+        self.engine = Engine(graph, on_event=self._on_event)
+        self.sessions: Dict[str, Session] = {}
+        self.answer_seconds: List[float] = []
+        self.events = 0
+        self._current: Optional[Session] = None
+
+    def _on_event(self, state, event) -> None:
+        if event[0] == ENTER:
+            self._current.entered.append(event[1])
+
+    def feed(self, event: List) -> None:
+        sid, t, kind, *args = event
+        self.events += 1
+        session = self.sessions.get(sid)
+        if session is None:
+            session = self.sessions[sid] = Session(sid)
+        if session.divergence is not None:
+            return
+        self._current = session
+        if kind == NEW:
+            session.state = new_state(self.engine.graph)
+            session.entered.clear()
+            session.version = args[0]
+            session.finished_at = None
+            self.engine.start(session.state)
+        elif kind == HOME:
+            session.state = None
+            session.entered.clear()
+        elif kind == ENTER:
+            replayed = session.entered.popleft() if session.entered else None
+            if replayed != args[0]:
+                session.divergence = (t, f"recorded entering {args[0]!r}, replay entered {replayed!r}")
+        elif kind == ANSWER:
+            stage, value = args
+            if session.state is None:
+                session.divergence = (t, f"answer at {stage!r} before the session started")
+            elif session.entered:
+                session.divergence = (t, f"replay entered {session.entered[0]!r}, which was not recorded")
+            elif session.state["stage"] != stage:
+                session.divergence = (t, f"answer recorded at {stage!r}, replay is at {session.state['stage']!r}")
+            else:
+                started = time.perf_counter()
+                try:
+                    self.engine.answer(session.state, value)
+                except InvalidAnswer as exc:
+                    session.divergence = (t, str(exc))
+                    return
+                self.answer_seconds.append(time.perf_counter() - started)
+                if self.engine.finished(session.state):
+                    session.finished_at = t
+
+    def finished(self) -> List[Session]:
+        return [s for s in self.sessions.values() if s.finished_at is not None and s.divergence is None]
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def rebuild_consultations(sessions: List[Session], path: Path) -> None:
+    sink = consultations.open_sink("sqlite" if path.suffix == ".db" else "jsonl", str(path))
+    for i in range(0, len(sessions), consultations.BATCH_SIZE):
+        sink.write([
+            consultations.record_row({
+                "id": s.sid,
+                "session": s.sid,
+                "finished_at": s.finished_at,
+                "profile": s.state["profile"],
+                "messages": [m.to_tuple() for m in s.state["messages"]],
+            })
+            for s in sessions[i:i + consultations.BATCH_SIZE]
+        ])
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m ehealth.replay", description=__doc__.split("\n")[0])
+    parser.add_argument("paths", nargs="+", type=Path, help="event logs, oldest first (rotated files sort first)")
+    parser.add_argument("--session", help="only replay this session id")
+    parser.add_argument("--transcript", action="store_true", help="print the replayed transcripts")
+    parser.add_argument("--consultations", type=Path, help="write finished sessions to this .db or .jsonl file")
+    args = parser.parse_args(argv)
+
+    replayer = Replayer()
+    started = time.perf_counter()
+    for event in read(sorted(args.paths)):
+        if args.session is None or event[0] == args.session:
+            replayer.feed(event)
+    elapsed = time.perf_counter() - started
+
+    sessions = replayer.sessions.values()
+    for session in sessions:
+        if args.transcript and session.state is not None:
+            print(f"# {session.sid} stage={session.state['stage']}")
+            for m in session.state["messages"]:
+                print(f"{m.role}: {m.image_path or m.content}")
+        if session.divergence is not None:
+            t, message = session.divergence
+            print(f"{session.sid} diverged at {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(t))}: {message}")
+    finished = replayer.finished()
+    if args.consultations is not None:
+        rebuild_consultations(finished, args.consultations)
+
+    other_script = sum(1 for s in sessions if s.version not in (None, SCRIPT_TEXTS.version))
+    diverged = sum(1 for s in sessions if s.divergence is not None)
+    rate = replayer.events / elapsed if elapsed else 0.0
+    print(
+        f"replayed {replayer.events} events from {len(replayer.sessions)} sessions in {elapsed:.3f}s ({rate:.0f} events/s): "
+        f"{len(finished)} finished, {diverged} diverged, {other_script} recorded with another script version; "
+        f"answer p50={_percentile(replayer.answer_seconds, 0.5) * 1e6:.0f}us "
+        f"p99={_percentile(replayer.answer_seconds, 0.99) * 1e6:.0f}us",
+        file=sys.stderr,
+    )
+    return 1 if diverged else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,321 @@
+"""首诊问诊脚本（严格按英文剧本）。
+
+每个节点即一个 stage，结构见 ehealth/dialogue.py。进入阶段时说 prompt，
+患者回答后按分支说 say 并跳到 next。GRAPH 在 import 时构建并校验。
+"""
+from ehealth import normalize, recommender
+from ehealth.dialogue import AUTO, BUTTONS, END, TEXT, Branch, DialogueGraph, Node, Say
+
+
+START = "receptionist_welcome"
+
+YES_NO = ("[Yes]", "[No]")
+DAYS_PER_WEEK = ("[0-2 days per week]", "[3-5 days per week]", "[6+ days per week]")
+HOW_OFTEN = ("[never]", "[every once in a while]", "[pretty often]", "[most nights]")
+
+STRESS_REPLY = Say("doctor", "Got it. Managing stress is an important and challenging task. But you know, stress isn't always bad. Sometimes it can motivate us to get things done.")
+ALCOHOL_REPLY = Say("doctor", "You know people have used alcohol and cigarettes to relieve stress for centuries. But, research results are mixed in terms of whether it can actually reduce stress.")
+
+FINAL_ADVICE = "Based on our chat, I think you are doing fine. But, you can always do better. After reviewing the AI system's recommendation, here is my advice for you:\n\n●Exercise at least 150 minutes a week. Choose moderate intensity activity such as brisk walking.\n●Improve your strength and flexibility. Practice muscle-strengthening activities at least 2 days a week, such as squats.\n●Customize and enjoy nutrient-dense food and beverage choices to reflect your personal preferences, cultural traditions, and budgetary considerations.\n●Choose a mix of healthy foods you like from each of the five groups: whole fruit, veggies, whole grains, proteins, and dairy.\n●Limit foods and beverages that are higher in added sugars, saturated fat, and sodium (salt)."
+
+
+def is_unemployed(answer: str, profile: dict) -> bool:
+    # 失业/学生/退休等跳过工作压力问题；就业状态已由 normalize.occupation 写入 profile
+    return profile["employment_status"] != normalize.EMPLOYED
+
+
+def doctor(*texts: str, delays=()) -> tuple:
+    return tuple(Say("doctor", t, delays[i] if i < len(delays) else 0) for i, t in enumerate(texts))
+
+
+NODES = [
+    # ---------------- 接待员 -----------------
+    Node(
+        "receptionist_welcome", BUTTONS,
+        prompt=(Say("receptionist", "Hi, welcome to the e-health platform"),),
+        options=("[Hi]",),
+        branches=(Branch("receptionist_help"),),
+    ),
+    Node(
+        "receptionist_help", BUTTONS,
+        prompt=(Say("receptionist", "How can I help you today?"),),
+        options=("[wellness checkup]",),
+        branches=(Branch("receptionist_intro"),),
+    ),
+    Node(
+        "receptionist_intro", AUTO,
+        prompt=(
+            Say("receptionist", "Sure. Please bear with me until I connect you to Dr. Alex. Meanwhile, you can read a brief introduction of Dr. Alex."),
+            Say("receptionist", "Dr. Alex received a medical degree from the University of Pittsburgh School of Medicine in 2005 and has been board certified in preventive care and medicine. Dr. Alex's particular expertise includes nutrition, fitness, and lifestyle."),
+        ),
+        branches=(Branch("doctor_greet"),),
+    ),
+    # ---------------- 医生：开场 -----------------
+    Node(
+        "doctor_greet", AUTO,
+        prompt=doctor("Hi, I am Dr. Alex. How would you like to be addressed?"),
+        branches=(Branch("doctor_name_input"),),
+    ),
+    Node(
+        "doctor_name_input", TEXT,
+        placeholder="[preferred name input]",
+        profile_key="preferred_name",
+        branches=(Branch("doctor_feel", doctor("{answer}, nice to meet you.")),),
+    ),
+    Node(
+        "doctor_feel", BUTTONS,
+        prompt=doctor("How are you doing lately?"),
+        options=("[good]", "[bad]", "[hard to say]"),
+        profile_key="feeling",
+        branches=(Branch("doctor_online"),),
+    ),
+    Node(
+        "doctor_online", BUTTONS,
+        prompt=doctor("Is this your first-time consulting doctors online for wellness?"),
+        options=("[yes]", "[no]"),
+        profile_key="first_time_online",
+        branches=(Branch("doctor_topics"),),
+    ),
+    Node(
+        "doctor_topics", BUTTONS,
+        prompt=doctor("Well, lots of people have consulted me about wellness. What topics do you want to know more about today?"),
+        options=("[diet]", "[fitness]", "[sleep]"),
+        profile_key="topics",
+        branches=(Branch("doctor_ongoing", doctor("Great. I will be sure to cover it in this checkup.")),),
+    ),
+    Node(
+        "doctor_ongoing", BUTTONS,
+        prompt=doctor("Do you have any ongoing health issues that I should be aware of?"),
+        options=YES_NO,
+        profile_key="ongoing_issues",
+        branches=(
+            Branch("doctor_issues_detail", on="[Yes]"),
+            Branch("doctor_job", on="[No]"),
+        ),
+    ),
+    Node(
+        "doctor_issues_detail", TEXT,
+        prompt=doctor("What are some health problems you have?"),
+        profile_key="issues_detail",
+        branches=(Branch("doctor_job", doctor("Thanks for letting me know. I will take your health status into account when providing suggestions.")),),
+    ),
+    # ---------------- 工作与压力 -----------------
+    Node(
+        "doctor_job", TEXT,
+        prompt=doctor("What do you do for a living?"),
+        profile_key="occupation",
+        normalize=normalize.occupation,
+        branches=(
+            Branch("doctor_relax", (STRESS_REPLY,), when=is_unemployed),
+            Branch("doctor_stress"),
+        ),
+    ),
+    Node(
+        "doctor_stress", TEXT,
+        prompt=doctor("How stressful are you at work? From 0-10, can you give me a number?"),
+        profile_key="work_stress",
+        normalize=normalize.work_stress,
+        branches=(Branch("doctor_relax", (STRESS_REPLY,)),),
+    ),
+    Node(
+        "doctor_relax", TEXT,
+        prompt=doctor("What do you often do to relax yourself?", delays=(0.5,)),
+        profile_key="relax",
+        branches=(Branch("doctor_smoke_question", doctor("I am glad that you know how to wind down.")),),
+    ),
+    # ---------------- 烟酒 -----------------
+    Node(
+        "doctor_smoke_question", AUTO,
+        prompt=doctor("Do you currently smoke cigarettes?"),
+        branches=(Branch("doctor_smoke"),),
+    ),
+    Node(
+        "doctor_smoke", BUTTONS,
+        options=YES_NO,
+        profile_key="smoke_now",
+        branches=(
+            Branch("doctor_smoke_6m", on="[Yes]"),
+            Branch("doctor_drink", on="[No]"),
+        ),
+    ),
+    Node(
+        "doctor_smoke_6m", BUTTONS,
+        prompt=doctor("Were you smoking 6 months ago?"),
+        options=YES_NO,
+        profile_key="smoke_6m",
+        branches=(Branch("doctor_drink"),),
+    ),
+    Node(
+        "doctor_drink", BUTTONS,
+        prompt=doctor("Do you drink alcohol?"),
+        options=YES_NO,
+        profile_key="drink",
+        branches=(
+            Branch("doctor_drink_freq", on="[Yes]"),
+            Branch("doctor_exercise", (ALCOHOL_REPLY,), on="[No]"),
+        ),
+    ),
+    Node(
+        "doctor_drink_freq", BUTTONS,
+        prompt=doctor("How often do you drink alcohol?"),
+        options=("[1-2 days a week]", "[3-5 days a week]", "[6-7 days a week]"),
+        profile_key="drink_freq",
+        branches=(Branch("doctor_exercise", (ALCOHOL_REPLY,)),),
+    ),
+    # ---------------- 运动与陪伴 -----------------
+    Node(
+        "doctor_exercise", BUTTONS,
+        prompt=doctor("How often do you exercise?", delays=(0.5,)),
+        options=("[never]", "[1-2 days per week]", "[3-5 days per week]", "[6+ days per week]"),
+        profile_key="exercise_freq",
+        branches=(
+            Branch("doctor_companionship", on="[never]"),
+            Branch("doctor_exercise_types"),
+        ),
+    ),
+    Node(
+        "doctor_exercise_types", TEXT,
+        prompt=doctor("What are some of the exercises you enjoy?"),
+        profile_key="exercise_types",
+        branches=(Branch("doctor_companionship"),),
+    ),
+    Node(
+        "doctor_companionship", BUTTONS,
+        prompt=doctor("How often do you feel that you lack companionship?"),
+        options=("[Hardly ever or never]", "[some of the time]", "[often]"),
+        profile_key="companionship",
+        branches=(
+            Branch("doctor_diet_intro", doctor("It seems like you are quite lonely. I'll suggest you talk to your friends and family more frequently. It may help."), on="[often]"),
+            Branch("doctor_diet_intro", doctor("It seems like you are a little bit lonely. I'll suggest you talk to your friends and family more frequently. It may help."), on="[some of the time]"),
+            Branch("doctor_diet_intro", doctor("It seems like you are not lonely at all. I am glad that you feel supported and fulfilled in your relationship,")),
+        ),
+    ),
+    # ---------------- 饮食 -----------------
+    Node(
+        "doctor_diet_intro", BUTTONS,
+        prompt=doctor(
+            "Next, I would like to know what you're currently eating.",
+            "You probably know that most foods can be categorized into five major groups, namely Fruit, Vegetables, Grains, Protein, and Dairy. I would like to know how often you eat from each group.",
+            delays=(0, 0.5),
+        ),
+        options=("[OK]",),
+        branches=(Branch("doctor_fruit"),),
+    ),
+    Node(
+        "doctor_fruit", BUTTONS,
+        prompt=doctor("How often do you eat fruits, such as apples, bananas, or oranges? The fruit can be fresh, frozen, canned, or dried. 100% fruit juice also counts as fruit."),
+        options=DAYS_PER_WEEK,
+        profile_key="fruit_freq",
+        branches=(Branch("doctor_vegetables"),),
+    ),
+    Node(
+        "doctor_vegetables", BUTTONS,
+        prompt=doctor("How about vegetables, like broccoli and cabbage?"),
+        options=DAYS_PER_WEEK,
+        profile_key="veg_freq",
+        branches=(Branch("doctor_grains"),),
+    ),
+    Node(
+        "doctor_grains", BUTTONS,
+        prompt=doctor("How often do you eat grains, such as wheat, bread, and pasta? Foods such as popcorn, rice, and oatmeal are also included as grains."),
+        options=DAYS_PER_WEEK,
+        profile_key="grain_freq",
+        branches=(Branch("doctor_protein"),),
+    ),
+    Node(
+        "doctor_protein", BUTTONS,
+        prompt=doctor("How about protein foods, such as seafood, meat, poultry, eggs, beans, peas, lentils, nuts, seeds, or soy products?"),
+        options=DAYS_PER_WEEK,
+        profile_key="protein_freq",
+        branches=(Branch("doctor_dairy"),),
+    ),
+    Node(
+        "doctor_dairy", BUTTONS,
+        prompt=doctor("How often do you eat dairy products, such as dairy milk, yogurt, and cheese?"),
+        options=DAYS_PER_WEEK,
+        profile_key="dairy_freq",
+        branches=(Branch("doctor_cook"),),
+    ),
+    Node(
+        "doctor_cook", BUTTONS,
+        prompt=doctor("Do you usually cook at home?"),
+        options=YES_NO,
+        profile_key="cook_at_home",
+        branches=(Branch("doctor_recipes"),),
+    ),
+    Node(
+        "doctor_recipes", BUTTONS,
+        prompt=doctor("How often do you try new recipes?"),
+        options=("[Never]", "[ Rarely]", "[ Sometimes]", "[ Often]", "[ Always]"),
+        profile_key="try_new_recipes",
+        branches=(Branch("doctor_sleep_quality"),),
+    ),
+    # ---------------- 睡眠 -----------------
+    Node(
+        "doctor_sleep_quality", TEXT,
+        prompt=doctor("How is your sleep quality lately? If 1 means very bad and 5 means very good, can you give me a number?"),
+        placeholder="[Answer input]",
+        profile_key="sleep_quality_1_5",
+        normalize=normalize.sleep_quality,
+        branches=(Branch("doctor_screen"),),
+    ),
+    Node(
+        "doctor_screen", BUTTONS,
+        prompt=doctor("Any screen time before bed? That is, do you look at a smartphone or tablet before falling asleep?"),
+        options=YES_NO,
+        profile_key="screen_before_bed",
+        branches=(Branch("doctor_fall_asleep"),),
+    ),
+    Node(
+        "doctor_fall_asleep", BUTTONS,
+        prompt=doctor("How often do you have difficulty falling asleep (1 hour or longer)?"),
+        options=HOW_OFTEN,
+        profile_key="diff_fall_asleep",
+        branches=(Branch("doctor_wake_trouble"),),
+    ),
+    Node(
+        "doctor_wake_trouble", BUTTONS,
+        prompt=doctor("Do you ever wake in the night and have trouble getting back to sleep?"),
+        options=HOW_OFTEN,
+        profile_key="night_wake_diff",
+        branches=(Branch("doctor_morning_tired"),),
+    ),
+    Node(
+        "doctor_morning_tired", BUTTONS,
+        prompt=doctor("How often do you wake up in the morning still feeling tired?"),
+        options=HOW_OFTEN,
+        profile_key="morning_tired",
+        branches=(Branch("doctor_family_sleep"),),
+    ),
+    Node(
+        "doctor_family_sleep", BUTTONS,
+        prompt=doctor("Some people have problems sleeping due to genetic reasons. Do you have a family history of sleep disorders, such as narcolepsy or sleep apnea?"),
+        options=("[yes]", "[no]"),
+        profile_key="family_sleep_history",
+        branches=(Branch("doctor_final_advice_confirm"),),
+    ),
+    # ---------------- 建议与结束 -----------------
+    Node(
+        "doctor_final_advice_confirm", BUTTONS,
+        prompt=doctor(FINAL_ADVICE),
+        compose=recommender.personal_advice,  # 按回答追加的个性化建议
+        options=("[OK]",),
+        branches=(Branch("end"),),
+    ),
+    Node(
+        "end", END,
+        prompt=doctor(
+            "Our receptionist will send you pamphlets of good practices of exercise and diet.",
+            "Thanks for your visit.",
+            "[The doctor has left the chat]",
+        ) + (
+            # Receptionist 分享两张宣传册
+            Say("receptionist", "Exercise Guidelines Pamphlet", image="图片1.png"),
+            Say("receptionist", "Mental Health Self-Care Guide", image="图片2.png"),
+            Say("receptionist", "You can right-click to save the pamphlets."),
+            Say("receptionist", "This is the end of your first doctor's visit. Here's the access code for you to continue the questionnaire: 9087. Please copy the code and return it to the questionnaire page to proceed."),
+        ),
+    ),
+]
+
+GRAPH = DialogueGraph(NODES, START)
@@ -0,0 +1,442 @@
+"""可替换的会话存储。
+
+对话状态（stage、profile、消息记录、已说过的提示语）默认和以前一样只活在本进程；
+换成共享存储后，每次脚本运行开始时按 sid 读取、结束时写回，任意一个 Streamlit
+工作进程都能接着处理同一个患者，负载均衡前不再需要粘性会话。
+
+EHEALTH_SESSION_STORE 选择后端：
+
+- memory（默认）：进程内字典，直接保存对象引用，不做序列化；
+- sqlite：EHEALTH_SESSION_STORE_URL 指定的数据库文件（默认 data/sessions.db，WAL 模式），
+  同一台机器上的多个进程共享；
+- redis：EHEALTH_SESSION_STORE_URL 指定的 Redis（或兼容服务），需要安装 redis 包。
+
+写回采用乐观并发：每条记录带版本号，保存时版本不符（另一个进程已经推进了这个会话）
+抛出 ConflictError，调用方丢弃本次改动、下次运行重新读取。内容没变的运行不写存储。
+
+内存存储按最近访问排序：空闲超过 EHEALTH_SESSION_IDLE_SECONDS（默认 1800 秒）、或常驻
+会话的估计总量超出 EHEALTH_SESSION_MEMORY_MB（默认 64）时，最久未访问的会话以紧凑
+编码换出到本进程的临时 SQLite 文件，患者回来时再读回；EHEALTH_SESSION_SPILL=0 时
+直接丢弃（开启检查点时仍可从检查点恢复）。运行结束时交回的渲染缓存（消息 HTML 片段）
+计入会话的内存估计，换出时一并释放，下次渲染重建；正在运行的会话不会被换出。
+"""
+import atexit
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from ehealth.asset_cache import APP_DIR
+from ehealth.messages import SCRIPT_TEXTS, Message
+from ehealth.metrics import REGISTRY
+
+
+STORE_KIND = os.environ.get("EHEALTH_SESSION_STORE", "memory")
+STORE_URL = os.environ.get("EHEALTH_SESSION_STORE_URL", "")
+IDLE_SECONDS = float(os.environ.get("EHEALTH_SESSION_IDLE_SECONDS", "1800"))
+MEMORY_BUDGET = int(float(os.environ.get("EHEALTH_SESSION_MEMORY_MB", "64")) * 1024 * 1024)
+SPILL = os.environ.get("EHEALTH_SESSION_SPILL", "1") not in ("", "0")
+
+# 存进会话存储的 st.session_state 字段；其余（渲染缓存、计数等）只属于当前连接
+FIELDS = ("stage", "profile", "messages", "said")
+
+COMPRESS_MIN_BYTES = 512  # 更短的记录压缩反而更大
+_PLAIN, _ZLIB = b"j", b"z"
+
+
+class ConflictError(RuntimeError):
+    """保存时版本号不符：会话已被其他进程更新。"""
+
+
+class Loaded(NamedTuple):
+    version: int
+    state: Dict
+    raw: Optional[bytes] = None  # 读出的原始字节，用于判断本次运行是否改动了状态
+
+
+# ---------------- 序列化 -----------------
+def encode(state: Dict) -> bytes:
+    """紧凑编码：消息只存 (角色, 文本下标, 参数, 延迟, 图片下标) 元组，并附文本表版本。"""
+    data = json.dumps(
+        [
+            SCRIPT_TEXTS.version,
+            state["stage"],
+            state["profile"],
+            [m.to_tuple() for m in state["messages"]],
+            sorted(state["said"]),
+        ],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+    if len(data) >= COMPRESS_MIN_BYTES:
+        return _ZLIB + zlib.compress(data, 6)
+    return _PLAIN + data
+
+
+def decode(raw: bytes) -> Dict:
+    data = raw[1:]
+    if raw[:1] == _ZLIB:
+        data = zlib.decompress(data)
+    text_version, stage, profile, messages, said = json.loads(data)
+    if text_version != SCRIPT_TEXTS.version:
+        # 剧本文本变了（新版本部署），旧记录中的文本下标已失效
+        raise ValueError(f"session was saved by script version {text_version}")
+    return {
+        "stage": stage,
+        "profile": profile,
+        "messages": [Message.from_tuple(m) for m in messages],
+        "said": set(said),
+    }
+
+
+def footprint(state: Dict, cache=None) -> int:
+    """会话常驻内存的粗略估计（字节），系数按 tracemalloc 对完整问诊的实测校准；
+    cache 为该会话的渲染缓存（有 nbytes() 方法），一并计入。"""
+    messages = state["messages"]
+    params = sum(len(m.param) for m in messages if m.param is not None)
+    size = 2560 + 112 * len(messages) + params + 64 * len(state["said"])
+    return size + (cache.nbytes() if cache is not None else 0)
+
+
+# ---------------- 后端 -----------------
+class SessionStore:
+    shared = True  # 状态是否跨进程共享（决定 sid 是否要放进 URL）
+
+    def load(self, sid: str, checkout: bool = False) -> Optional[Loaded]:
+        """checkout=True 表示调用方接下来会原地修改状态，结束时须调用 checkin()。"""
+        raw = self._get(sid)
+        if raw is None:
+            return None
+        version, blob = raw
+        try:
+            return Loaded(version, decode(blob), blob)
+        except (ValueError, zlib.error):
+            # 旧剧本版本写入、或记录已损坏（截断的压缩数据、无效 JSON）：删掉重新开始，
+            # 否则新会话按版本 1 写入时会一直与这条记录冲突
+            self.delete(sid)
+            return None
+
+    def checkin(self, sid: str, cache=None) -> None:
+        """一次运行结束；cache 为该会话的渲染缓存（共享存储不保存它）。"""
+
+    def save(self, sid: str, state: Dict, loaded: Optional[Loaded]) -> Loaded:
+        """写回状态，返回新的 Loaded；内容未变时不访问存储。"""
+        blob = encode(state)
+        if loaded is not None and blob == loaded.raw:
+            return loaded
+        version = (loaded.version if loaded else 0) + 1
+        self._put(sid, blob, version)
+        return Loaded(version, state, blob)
+
+    def delete(self, sid: str) -> None:
+        raise NotImplementedError
+
+    def _get(self, sid: str):
+        raise NotImplementedError
+
+    def _put(self, sid: str, blob: bytes, version: int) -> None:
+        """仅当存储中的版本为 version-1（新会话为不存在）时写入，否则抛出 ConflictError。"""
+        raise NotImplementedError
+
+
+class _Resident:
+    __slots__ = ("loaded", "size", "touched", "cache")
+
+    def __init__(self, loaded: Loaded, size: int, touched: float, cache=None):
+        self.loaded = loaded
+        self.size = size
+        self.touched = touched
+        self.cache = cache
+
+
+class MemoryStore(SessionStore):
+    shared = False
+
+    def __init__(self, idle_seconds: float = IDLE_SECONDS, budget: int = MEMORY_BUDGET, spill: bool = SPILL):
+        self._lock = threading.Lock()
+        self._spilled = threading.Condition(self._lock)  # 换出写盘完成时通知
+        # 按最近访问排序：队首是最久未访问的会话
+        self._sessions: "OrderedDict[str, _Resident]" = OrderedDict()
+        # 正在运行的会话（sid -> checkout 次数）：脚本线程可能正在原地修改状态，不换出
+        self._running: Dict[str, int] = {}
+        # 已移出内存、正在写入换出文件的会话；其间对这些 sid 的读写等待写盘完成
+        self._spilling: Dict[str, _Resident] = {}
+        self.idle_seconds = idle_seconds
+        self.budget = budget
+        self.resident_bytes = 0
+        self.evictions = 0
+        self.rehydrations = 0
+        self.spill = spill
+        self._spill: Optional[SqliteStore] = None  # 第一次换出时才创建
+
+    def load(self, sid: str, checkout: bool = False) -> Optional[Loaded]:
+        with self._lock:
+            self._wait_spilled(sid)
+            if checkout:
+                self._running[sid] = self._running.get(sid, 0) + 1
+            entry = self._sessions.get(sid)
+            if entry is not None:
+                entry.touched = time.monotonic()
+                self._sessions.move_to_end(sid)
+                return entry.loaded
+            if self._spill is None:
+                return None
+            loaded = self._spill.load(sid)
+            if loaded is None:
+                return None
+            # 读回内存，换出记录随即删除；版本号保持不变，CAS 照常进行
+            self._spill.delete(sid)
+            loaded = Loaded(loaded.version, loaded.state)
+            self._admit(sid, loaded)
+            self.rehydrations += 1
+            return loaded
+
+    def checkin(self, sid: str, cache=None) -> None:
+        with self._lock:
+            running = self._running.pop(sid, 0) - 1
+            if running > 0:
+                self._running[sid] = running
+            entry = self._sessions.get(sid)
+            if entry is None:
+                return  # 已删除（Reset）
+            if cache is not None:
+                entry.cache = cache
+                self._admit(sid, entry.loaded)
+            victims = self._evict(keep=sid)
+        self._spill_out(victims)
+
+    def save(self, sid: str, state: Dict, loaded: Optional[Loaded]) -> Loaded:
+        # 保存的是对象引用：同一进程内无需序列化，原地修改即已生效
+        with self._lock:
+            self._wait_spilled(sid)
+            entry = self._sessions.get(sid)
+            current = entry.loaded if entry else None
+            if current is not None:
+                version = current.version
+            else:
+                # 运行期间被换出：与换出记录比较版本；已被丢弃的会话按原版本重新收回
+                spilled = self._spill._get(sid) if self._spill is not None else None
+                version = spilled[0] if spilled else (loaded.version if loaded else 0)
+                if spilled:
+                    self._spill.delete(sid)
+            if version != (loaded.version if loaded else 0):
+                raise ConflictError(sid)
+            if current is not None and all(current.state[k] is state[k] for k in FIELDS):
+                saved = current
+            else:
+                saved = Loaded(version + 1, dict(state))
+            self._admit(sid, saved)
+            victims = self._evict(keep=sid)
+        self._spill_out(victims)
+        return saved
+
+    def _admit(self, sid: str, loaded: Loaded) -> None:
+        entry = self._sessions.pop(sid, None)
+        cache = None
+        if entry is not None:
+            self.resident_bytes -= entry.size
+            cache = entry.cache
+        size = footprint(loaded.state, cache)
+        self._sessions[sid] = _Resident(loaded, size, time.monotonic(), cache)
+        self.resident_bytes += size
+
+    def _wait_spilled(self, sid: str) -> None:
+        # 持有锁时调用：该会话正在写入换出文件时等它写完，之后按换出记录处理
+        while sid in self._spilling:
+            self._spilled.wait()
+
+    def _evict(self, keep: str) -> List[Tuple[str, _Resident]]:
+        """选出要换出的会话并移出内存（持有锁时调用，不做磁盘 I/O）：空闲超时的会话，
+        仍超预算时继续按最久未访问选。刚保存的会话和正在运行的会话（脚本线程可能正在
+        修改其状态）跳过。返回的会话由 _spill_out 在锁外写盘。"""
+        deadline = time.monotonic() - self.idle_seconds
+        victims = []
+        for sid, entry in list(self._sessions.items()):
+            if entry.touched > deadline and self.resident_bytes <= self.budget:
+                break
+            if sid == keep or sid in self._running:
+                continue
+            del self._sessions[sid]
+            self.resident_bytes -= entry.size
+            self.evictions += 1
+            if entry.cache is not None:
+                # 浏览器标签页可能还开着，它的 st.session_state 仍引用这个缓存：原地清空
+                entry.cache.release()
+            if self.spill:
+                self._spilling[sid] = entry
+                victims.append((sid, entry))
+        if victims:
+            self._spill_store()
+        return victims
+
+    def _spill_out(self, victims: List[Tuple[str, _Resident]]) -> None:
+        """在锁外编码并写入换出文件，完成后唤醒等待这些 sid 的读写。"""
+        if not victims:
+            return
+        try:
+            for sid, entry in victims:
+                self._spill.overwrite(sid, encode(entry.loaded.state), entry.loaded.version)
+        finally:
+            with self._lock:
+                for sid, _ in victims:
+                    self._spilling.pop(sid, None)
+                self._spilled.notify_all()
+
+    def _spill_store(self) -> "SqliteStore":
+        if self._spill is None:
+            # 换出文件只属于本进程（类似 swap），退出时删除；跨重启的恢复由检查点负责
+            fd, path = tempfile.mkstemp(prefix="ehealth-spill-", suffix=".db")
+            os.close(fd)
+            self._spill = SqliteStore(Path(path))
+            atexit.register(self._spill.remove)
+        return self._spill
+
+    def delete(self, sid: str) -> None:
+        with self._lock:
+            self._wait_spilled(sid)
+            entry = self._sessions.pop(sid, None)
+            if entry is not None:
+                self.resident_bytes -= entry.size
+            if self._spill is not None:
+                self._spill.delete(sid)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "resident": len(self._sessions),
+                "resident_bytes": self.resident_bytes,
+                "spilled": self._spill.count() if self._spill is not None else 0,
+                "evictions_total": self.evictions,
+                "rehydrations_total": self.rehydrations,
+            }
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+class SqliteStore(SessionStore):
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = str(path)
+        self._local = threading.local()  # sqlite 连接不能跨线程共享
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (sid TEXT PRIMARY KEY, version INTEGER NOT NULL, data BLOB NOT NULL, "
+            "updated REAL NOT NULL DEFAULT 0)"
+        )
+        if "updated" not in {row[1] for row in conn.execute("PRAGMA table_info(sessions)")}:
+            # 早期的表没有写入时间；这些记录在第一次 purge 时清理
+            conn.execute("ALTER TABLE sessions ADD COLUMN updated REAL NOT NULL DEFAULT 0")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _get(self, sid: str):
+        return self._conn().execute("SELECT version, data FROM sessions WHERE sid = ?", (sid,)).fetchone()
+
+    def _put(self, sid: str, blob: bytes, version: int) -> None:
+        conn = self._conn()
+        with conn:
+            if version == 1:
+                cur = conn.execute(
+                    "INSERT OR IGNORE INTO sessions (sid, version, data, updated) VALUES (?, ?, ?, ?)",
+                    (sid, version, blob, time.time()),
+                )
+            else:
+                cur = conn.execute(
+                    "UPDATE sessions SET version = ?, data = ?, updated = ? WHERE sid = ? AND version = ?",
+                    (version, blob, time.time(), sid, version - 1),
+                )
+            if cur.rowcount != 1:
+                raise ConflictError(sid)
+
+    def overwrite(self, sid: str, blob: bytes, version: int) -> None:
+        """不做版本比较直接写入（内存存储换出时使用）。"""
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (sid, version, data, updated) VALUES (?, ?, ?, ?)",
+                (sid, version, blob, time.time()),
+            )
+
+    def delete(self, sid: str) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+    def purge(self, max_age: float) -> int:
+        """删除超过 max_age 秒没有写入的记录，返回删除的条数。"""
+        conn = self._conn()
+        with conn:
+            return conn.execute("DELETE FROM sessions WHERE updated < ?", (time.time() - max_age,)).rowcount
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def remove(self) -> None:
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.unlink(self.path + suffix)
+            except OSError:
+                pass
+
+
+# 版本号比较与写入在服务端原子完成
+_REDIS_CAS = """
+local current = tonumber(redis.call('HGET', KEYS[1], 'v') or '0')
+if current ~= tonumber(ARGV[1]) - 1 then return 0 end
+redis.call('HSET', KEYS[1], 'v', ARGV[1], 'd', ARGV[2])
+return 1
+"""
+
+
+class RedisStore(SessionStore):
+    KEY_PREFIX = "ehealth:session:"
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError as exc:
+            raise RuntimeError("EHEALTH_SESSION_STORE=redis requires the 'redis' package") from exc
+        self.client = redis.Redis.from_url(url or "redis://127.0.0.1:6379/0")
+        self._cas = self.client.register_script(_REDIS_CAS)
+
+    def _get(self, sid: str):
+        version, blob = self.client.hmget(self.KEY_PREFIX + sid, "v", "d")
+        return None if blob is None else (int(version), blob)
+
+    def _put(self, sid: str, blob: bytes, version: int) -> None:
+        if not self._cas(keys=[self.KEY_PREFIX + sid], args=[version, blob]):
+            raise ConflictError(sid)
+
+    def delete(self, sid: str) -> None:
+        self.client.delete(self.KEY_PREFIX + sid)
+
+
+def open_store(kind: str = STORE_KIND, url: str = STORE_URL) -> SessionStore:
+    if kind == "memory":
+        return MemoryStore()
+    if kind == "sqlite":
+        return SqliteStore(Path(url) if url else APP_DIR / "data" / "sessions.db")
+    if kind == "redis":
+        return RedisStore(url)
+    raise ValueError(f"unknown EHEALTH_SESSION_STORE {kind!r}")
+
+
+# 进程级单例，启动时即校验配置
+STORE = open_store()
+if isinstance(STORE, MemoryStore):
+    REGISTRY.add_collector(lambda: {f"sessions_{k}": v for k, v in STORE.stats().items()})
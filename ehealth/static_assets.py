@@ -0,0 +1,112 @@
+"""以静态文件方式提供宣传册图片。
+
+开启 Streamlit 的 ``server.enableStaticServing`` 后，应用目录下 ``static/`` 中的文件
+会以 ``app/static/<文件名>`` 的地址对外提供。这里把源图片按内容哈希命名后发布到
+该目录，聊天界面只需输出 ``<img src>`` 引用，不再把整张图 base64 内联进 HTML。
+URL 上附带 ``?v=<哈希>``，Tornado 的静态文件处理器据此返回长期缓存头。
+
+静态服务不可用（未开启配置、目录不可写等）时返回 None，由调用方回退到内联模式。
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from ehealth.asset_cache import APP_DIR, resolve_asset
+
+
+STATIC_DIR = APP_DIR / "static"
+STATIC_URL_PREFIX = "app/static/"
+
+# auto：按 Streamlit 配置决定；static：强制静态；inline：强制内联 base64
+ASSET_MODE = os.environ.get("EHEALTH_ASSET_MODE", "auto").lower()
+
+_lock = threading.Lock()
+# 源文件 (路径, mtime, size) -> 已发布的 URL
+_published: Dict[Tuple[Path, int, int], str] = {}
+
+
+def static_serving_enabled() -> bool:
+    if ASSET_MODE == "inline":
+        return False
+    if ASSET_MODE == "static":
+        return True
+    try:
+        import streamlit as st
+
+        return bool(st.get_option("server.enableStaticServing"))
+    except Exception:
+        return False
+
+
+def content_hash(data_bytes: bytes) -> str:
+    return hashlib.sha256(data_bytes).hexdigest()[:16]
+
+
+def hashed_name(source: Path, digest: str) -> str:
+    # 中文文件名在 URL 中需要转义，统一改用 ASCII 的内容哈希文件名
+    return f"asset-{digest}{source.suffix.lower()}"
+
+
+def _atomic_write(name: str, write) -> Path:
+    """原子地在 static/ 下生成文件；同名文件已存在时直接复用（内容由哈希保证一致）。"""
+    target = STATIC_DIR / name
+    if target.is_file():
+        return target
+    STATIC_DIR.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=STATIC_DIR, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            write(out)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, target)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+    return target
+
+
+def publish_file(source: Path, name: str) -> Path:
+    def copy(out):
+        with open(source, "rb") as src:
+            shutil.copyfileobj(src, out)
+
+    return _atomic_write(name, copy)
+
+
+def publish_bytes(name: str, data_bytes: bytes) -> Path:
+    return _atomic_write(name, lambda out: out.write(data_bytes))
+
+
+def url_for(name: str, version: str) -> str:
+    return f"{STATIC_URL_PREFIX}{name}?v={version}"
+
+
+def static_url(image_path: str) -> Optional[str]:
+    """返回图片的静态 URL；静态服务不可用或发布失败时返回 None。"""
+    if not static_serving_enabled():
+        return None
+    source = resolve_asset(image_path)
+    if source is None:
+        return None
+    try:
+        st = source.stat()
+    except OSError:
+        return None
+    key = (source, st.st_mtime_ns, st.st_size)
+    with _lock:
+        url = _published.get(key)
+        if url is not None:
+            return url
+        try:
+            digest = content_hash(source.read_bytes())
+            name = hashed_name(source, digest)
+            publish_file(source, name)
+        except OSError:
+            return None
+        url = url_for(name, digest)
+        _published[key] = url
+    return url
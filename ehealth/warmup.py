@@ -0,0 +1,139 @@
+"""进程启动预热：在第一位患者之前把剧本、样式模板和宣传册资源准备好。
+
+app_strict.py 在脚本顶部调用 warm()，每个进程只真正执行一次：
+
+1. files：剧本引用的图片、assets/*.txt、聊天前端文件必须存在；
+2. script：剧本文本表与对话图（import 时已校验）中的每句话都能按文本下标还原；
+3. advice：加载饮食/运动指南和建议规则表，编译索引并对照剧本校验；创建推荐后端
+   （EHEALTH_RECOMMENDER 配置无效时在这里报错）；
+4. templates：样式表、页面模板在 import 时构建，再各渲染一条消息走一遍热路径；
+5. assets：生成宣传册的缩放变体并预先编码为 data URL（静态服务不可用时内联）。
+
+任何一步失败抛出 StartupError，应用直接报错而不是在问诊中途才出问题。各步耗时
+打印到 stderr，并在 EHEALTH_METRICS=1 时记入 ehealth_startup_seconds。部署前或
+作为健康检查也可以单独运行（失败时退出码非 0）::
+
+    python -m ehealth.warmup
+"""
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+from ehealth import advice, metrics, recommender
+from ehealth.asset_cache import APP_DIR, asset_cache, resolve_asset
+from ehealth.asset_pipeline import pamphlet_variants
+from ehealth.chat_render import chat_page, chat_page_lite, render_message, render_message_lite
+from ehealth.engine import new_profile
+from ehealth.messages import ROLES, SCRIPT_TEXTS, Message
+from ehealth.script import GRAPH
+
+
+REQUIRED_FILES = (
+    "assets/diet.txt",
+    "assets/exercise.txt",
+    "ehealth/chat_frontend/index.html",
+    "ehealth/chat_frontend/chat.css",
+    "ehealth/chat_frontend/chat-lite.css",
+    "ehealth/chat_frontend/playback.js",
+)
+
+
+class StartupError(RuntimeError):
+    """启动预热发现缺失或无效的资源。"""
+
+
+def script_images() -> List[str]:
+    images = []
+    for node in GRAPH.nodes.values():
+        lines = list(node.prompt) + [line for b in node.branches for line in b.say]
+        images.extend(line.image for line in lines if line.image and line.image not in images)
+    return images
+
+
+def check_files() -> None:
+    missing = [path for path in script_images() if resolve_asset(path) is None]
+    missing += [path for path in REQUIRED_FILES if not (APP_DIR / path).is_file()]
+    if missing:
+        raise StartupError(f"missing files: {', '.join(missing)}")
+
+
+def check_script() -> None:
+    for node in GRAPH.nodes.values():
+        for line in list(node.prompt) + [line for b in node.branches for line in b.say]:
+            for text in (line.text, line.image):
+                if text is not None and SCRIPT_TEXTS.lookup(text) is None:
+                    raise StartupError(f"stage {node.id!r}: text is not in the script text table: {text[:40]!r}")
+
+
+def load_advice() -> None:
+    try:
+        advice.engine().validate(GRAPH, new_profile())
+    except (OSError, advice.AdviceError) as exc:
+        raise StartupError(f"advice rules: {exc}") from None
+    try:
+        recommender.SERVICE.backend()
+    except recommender.RecommenderError as exc:
+        raise StartupError(str(exc)) from None
+
+
+def build_templates() -> None:
+    for role in ROLES:
+        render_message(0, Message(role, "warm-up"))
+        render_message_lite(0, Message(role, "warm-up"))
+    chat_page("", 0)
+    chat_page_lite("")
+
+
+def encode_assets() -> None:
+    for image_path in script_images():
+        variants = pamphlet_variants(image_path)
+        # html 模式在没有静态服务时内联 1x WebP（没有 Pillow 时内联原图）
+        source = str(variants.webp[0].path) if variants is not None else image_path
+        if asset_cache.data_url(source) is None:
+            raise StartupError(f"cannot read {source}")
+
+
+STEPS = (
+    ("files", check_files),
+    ("script", check_script),
+    ("advice", load_advice),
+    ("templates", build_templates),
+    ("assets", encode_assets),
+)
+
+_lock = threading.Lock()
+_report: Optional[Dict[str, float]] = None
+
+
+def warm() -> Dict[str, float]:
+    """执行预热（每个进程一次），返回各步耗时（秒）；失败抛出 StartupError。"""
+    global _report
+    with _lock:
+        if _report is not None:
+            return _report
+        report = {}
+        started = time.perf_counter()
+        for name, step in STEPS:
+            step_started = time.perf_counter()
+            step()
+            report[name] = time.perf_counter() - step_started
+        report["total"] = time.perf_counter() - started
+        metrics.startup(report)
+        steps = ", ".join(f"{name} {seconds * 1000:.1f}ms" for name, seconds in report.items() if name != "total")
+        print(f"ehealth warm-up finished in {report['total'] * 1000:.1f}ms ({steps})", file=sys.stderr, flush=True)
+        _report = report
+        return report
+
+
+def main() -> int:
+    try:
+        warm()
+    except StartupError as exc:
+        print(f"warm-up failed: {exc}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())